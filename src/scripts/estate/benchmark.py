@@ -0,0 +1,200 @@
+"""End-to-end throughput benchmark of runFormFill against the local portal stand-in.
+
+Seeds synthetic records into a scratch Mongo database, logs in to the
+stand-in and runs one batch per tab count, reporting records/minute,
+per-step p50/p95 and the number of CDP commands sent.
+
+    BENCH_MONGO_URI=mongodb://localhost:27017 python benchmark.py --records 40 --tabs 1,2,4
+
+Never point BENCH_MONGO_URI at the production database: the benchmark
+creates and deletes its own batches in it.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Benchmark runFormFill against the local portal stand-in")
+    _parser.add_argument("--records", type=int, default=20, help="records per run")
+    _parser.add_argument("--tabs", default="1,2,4", help="comma-separated tab counts to compare")
+    _parser.add_argument("--port", type=int, default=8765)
+    _parser.add_argument("--latency", type=float, default=0.05, help="stand-in latency per request, seconds")
+    _parser.add_argument("--jitter", type=float, default=0.05)
+    _parser.add_argument("--error-rate", type=float, default=0.0)
+    _parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = _parser.parse_args()
+
+    if not os.getenv("BENCH_MONGO_URI"):
+        sys.exit("Set BENCH_MONGO_URI to a scratch MongoDB; the benchmark writes and deletes records there")
+    # Configuration is read at import time, so it has to be in place before the worker modules load
+    os.environ["MONGO_URI"] = os.environ["BENCH_MONGO_URI"]
+    os.environ["MONGO_DB"] = os.getenv("BENCH_MONGO_DB", "taqeemBenchmark")
+    os.environ["PORTAL_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["LOGIN_URL"] = f"http://127.0.0.1:{args.port}/login"
+    os.environ.setdefault("HEADLESS", "true")
+
+from nodriver.core.connection import Connection
+from browser import get_browser, closeBrowser, LOGIN_URL
+from formStore import db, form_writer
+from formFiller import runFormFill
+from progress import progress_channel
+from login import startLogin, submitOtp
+from standinPortal import start_standin, REGIONS, ASSET_USAGES
+
+_cdp_calls = Counter()
+
+
+def count_cdp_calls():
+    """Count every CDP command by method name; tabs and the browser share Connection.send"""
+    original = Connection.send
+
+    async def send(self, cdp_obj, *args, **kwargs):
+        _cdp_calls[getattr(cdp_obj, "__name__", type(cdp_obj).__name__)] += 1
+        return await original(self, cdp_obj, *args, **kwargs)
+
+    Connection.send = send
+
+
+def synthetic_record(batch_id, index, pdf_path):
+    region_code, (region_name, cities) = list(REGIONS.items())[index % len(REGIONS)]
+    asset_type = str(index % 3 + 1)
+    return {
+        "batch_id": batch_id,
+        "row_number": index,
+        "report_title": f"Benchmark report {index}",
+        "valuation_purpose": "1",
+        "value_premise": "1",
+        "value_base": "1",
+        "report_type": "Detailed report",
+        "valuation_date": "01-01-2025",
+        "report_issuing_date": "02-01-2025",
+        "assumptions": "None",
+        "special_assumptions": "None",
+        "final_value": str(100000 + index),
+        "valuation_currency": "1",
+        "report_asset_file": pdf_path,
+        "client_name": "Benchmark client",
+        "telephone_number": "0500000000",
+        "email_address": "bench@example.com",
+        "has_other_users": "",
+        "valuer_name": "1",
+        "contribution_percentage": "1",
+        "asset_type": asset_type,
+        "inspection_date": "01-01-2025",
+        "market_approach": "1",
+        "comparable_transactions_method": str(100000 + index),
+        "longitude": "46.6753",
+        "latitude": "24.7136",
+        "asset_usage_sector": next(iter(ASSET_USAGES[asset_type])),
+        "country": "Saudi Arabia",
+        "region": region_name,
+        "city": list(cities.values())[index % len(cities)],
+        "land_area": "500",
+        "land_leased": "No",
+        "best_use": "Yes",
+        "asset_age": "5",
+        "street_width": "20",
+    }
+
+
+async def login(browser):
+    page = await browser.get(LOGIN_URL)
+    with contextlib.redirect_stdout(sys.stderr):
+        result = await startLogin(page, "bench@example.com", "benchmark")
+        if result.get("status") == "OTP_REQUIRED":
+            result = await submitOtp(page, "123456")
+    if result.get("status") not in ("SUCCESS", "LOGIN_SUCCESS"):
+        raise RuntimeError(f"Login to the stand-in failed: {result}")
+
+
+async def run_once(browser, num_tabs, num_records, pdf_path):
+    batch_id = f"bench-{num_tabs}-{int(time.time() * 1000)}"
+    await db.taqeemForms.insert_many([synthetic_record(batch_id, i, pdf_path) for i in range(num_records)])
+    _cdp_calls.clear()
+    started = time.monotonic()
+    try:
+        # runFormFill reports progress on stdout; keep the benchmark's own output readable
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = await runFormFill(browser, batch_id, num_tabs=num_tabs)
+        await form_writer.flush()
+    finally:
+        await db.taqeemForms.delete_many({"batch_id": batch_id})
+
+    elapsed = time.monotonic() - started
+    metrics = result.get("metrics") or {}
+    return {
+        "tabs": num_tabs,
+        "status": result.get("status"),
+        "records": num_records,
+        "successful": result.get("successful_records", 0),
+        "failed": result.get("failed_records", 0),
+        "seconds": round(elapsed, 2),
+        "records_per_min": round(result.get("successful_records", 0) * 60 / max(elapsed, 1e-6), 2),
+        "steps": metrics.get("steps", {}),
+        "cdp_calls": sum(_cdp_calls.values()),
+        "cdp_by_method": dict(_cdp_calls.most_common(10)),
+        "error": result.get("error"),
+    }
+
+
+def print_report(results):
+    steps = sorted({step for r in results for step in r["steps"]})
+    header = ["tabs", "ok/total", "rec/min", "cdp/rec"] + [f"{s} p50/p95" for s in steps]
+    rows = []
+    for r in results:
+        row = [str(r["tabs"]), f"{r['successful']}/{r['records']}", f"{r['records_per_min']:.1f}",
+               f"{r['cdp_calls'] / max(r['records'], 1):.1f}"]
+        for step in steps:
+            s = r["steps"].get(step)
+            row.append(f"{s['p50']:.2f}/{s['p95']:.2f}" if s and s["p50"] is not None else "-")
+        rows.append(row)
+    widths = [max(len(line[i]) for line in [header] + rows) for i in range(len(header))]
+    for line in [header] + rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+    for r in results:
+        if r["error"]:
+            print(f"tabs={r['tabs']}: {r['error']}")
+
+
+async def main(args):
+    server, portal = start_standin(args.port, args.latency, args.jitter, args.error_rate)
+    count_cdp_calls()
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as pdf:
+        pdf.write(b"%PDF-1.4\n%%EOF\n")
+
+    # Progress goes out from the channel's writer thread, so silence it there rather than per run
+    progress_sink = open(os.devnull, "wb")
+    progress_channel.stream = progress_sink
+
+    results = []
+    try:
+        browser = await get_browser()
+        await login(browser)
+        for num_tabs in [int(t) for t in args.tabs.split(",") if t.strip()]:
+            result = await run_once(browser, num_tabs, args.records, pdf.name)
+            results.append(result)
+            print(f"tabs={num_tabs}: {result['records_per_min']} records/min, {result['cdp_calls']} CDP calls",
+                  file=sys.stderr)
+    finally:
+        await form_writer.close()
+        await closeBrowser()
+        server.shutdown()
+        os.unlink(pdf.name)
+        progress_channel.close()
+        progress_sink.close()
+
+    print_report(results)
+    print(f"stand-in served {portal.requests} requests, saved {portal.saved} reports")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(args))
@@ -1,23 +1,88 @@
-import asyncio, os, time, json
+import asyncio, os, sys, time, json
 import nodriver as uc
+from nodriver import cdp
 from dotenv import load_dotenv
+from interception import install_interception
+from session import restore_session, open_session_tab, close_session_tab
+from tabState import tab_state
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 load_dotenv()
 
+# Overridable so the worker can be pointed at the local stand-in portal (standinPortal.py)
+PORTAL_BASE_URL = os.getenv("PORTAL_BASE_URL", "https://qima.taqeem.sa").rstrip("/")
+FORM_URL = f"{PORTAL_BASE_URL}/report/create/1/137"
+LOGIN_URL = os.getenv(
+    "LOGIN_URL",
+    "https://sso.taqeem.gov.sa/realms/REL_TAQEEM/protocol/openid-connect/auth"
+    "?client_id=cli-qima-valuers&redirect_uri=https%3A%2F%2Fqima.taqeem.sa%2Fkeycloak%2Flogin%2Fcallback"
+    "&scope=openid&response_type=code"
+)
+
+# "nodriver" drives a real Chrome; "fake" is the in-memory fakeBrowser backend
+BROWSER_BACKEND = os.getenv("BROWSER_BACKEND", "nodriver").lower()
+
+# Portal pages leak memory in long-lived tabs: a tab is replaced after this many records (0 = never)
+TAB_RECYCLE_RECORDS = int(os.getenv("TAB_RECYCLE_RECORDS", "200"))
+# ...or once its JS heap passes this, or the largest tab once all of Chrome passes CHROME_MEMORY_LIMIT_MB (0 = off)
+TAB_MEMORY_LIMIT_MB = float(os.getenv("TAB_MEMORY_LIMIT_MB", "512"))
+CHROME_MEMORY_LIMIT_MB = float(os.getenv("CHROME_MEMORY_LIMIT_MB", "0"))
+MEMORY_SAMPLE_INTERVAL = float(os.getenv("MEMORY_SAMPLE_INTERVAL", "60"))
+# Crash detection: how often a running batch probes Chrome, and how long a probe may take
+BROWSER_CHECK_INTERVAL = float(os.getenv("BROWSER_CHECK_INTERVAL", "5"))
+BROWSER_PING_TIMEOUT = float(os.getenv("BROWSER_PING_TIMEOUT", "10"))
+
 browser = None
 page = None
 
-async def wait_for_element(page, selector, timeout=30, check_interval=1):
-    start_time = time.time()
-    while time.time() - start_time < timeout:
+_WAIT_FOR_SELECTOR_JS = """
+new Promise((resolve) => {
+    const selector = %s;
+    if (document.querySelector(selector)) {
+        resolve(true);
+        return;
+    }
+    const observer = new MutationObserver(() => {
+        if (document.querySelector(selector)) {
+            observer.disconnect();
+            clearTimeout(timer);
+            resolve(true);
+        }
+    });
+    const timer = setTimeout(() => {
+        observer.disconnect();
+        resolve(false);
+    }, %d);
+    observer.observe(document.documentElement || document, {childList: true, subtree: true, attributes: true});
+})
+"""
+
+async def wait_for_element(page, selector, timeout=30):
+    """Wait until selector matches, resolved in-page by a MutationObserver instead of CDP polling"""
+    deadline = time.time() + timeout
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
         try:
-            element = await page.query_selector(selector)
-            if element:
-                return element
+            found = await page.evaluate(
+                _WAIT_FOR_SELECTOR_JS % (json.dumps(selector), int(remaining * 1000)),
+                await_promise=True,
+                return_by_value=True
+            )
+            if found is True:
+                element = await page.query_selector(selector)
+                if element:
+                    return element
         except Exception:
             pass
-        await asyncio.sleep(check_interval)
-    return None
+        # The document was replaced mid-wait (navigation) or the match vanished again;
+        # give the new document a moment to get an execution context and observe again
+        await asyncio.sleep(0.1)
 
 async def get_browser(force_new=False):
     global browser
@@ -25,6 +90,11 @@ async def get_browser(force_new=False):
     if force_new and browser:
         await closeBrowser()
 
+    if browser is None and BROWSER_BACKEND == "fake":
+        # In-memory backend for profiling the Python side without Chrome (profile_pipeline.py)
+        from fakeBrowser import FakeBrowser
+        browser = FakeBrowser()
+
     if browser is None:
         headless = os.getenv("HEADLESS", "false").lower() in ("true", "1", "yes")
         print(json.dumps({"type": "DEBUG", "message": f"Headless mode: {headless}"}), flush=True)
@@ -51,9 +121,51 @@ async def get_browser(force_new=False):
             ],
             window_size=(1920, 1080)
         )
+        if browser.main_tab:
+            # No-op unless RESOURCE_BLOCKING is on; later tabs get it from readiness.navigate
+            await install_interception(browser.main_tab)
+            if not force_new:
+                # A restart or a shard starts logged in when an earlier OTP left a session behind
+                await restore_session(browser.main_tab)
     return browser
 
 
+async def browser_alive(b, timeout=BROWSER_PING_TIMEOUT):
+    """False once Chrome's process has exited or it stops answering on its DevTools connection"""
+    process = getattr(b, "_process", None)
+    if process is not None and process.returncode is not None:
+        return False
+    connection = getattr(b, "connection", None)
+    if connection is None:
+        # The fake backend
+        return not getattr(b, "stopped", False)
+    try:
+        await asyncio.wait_for(connection.send(cdp.browser.get_version()), timeout)
+        return True
+    except Exception:
+        return False
+
+
+_restart_lock = asyncio.Lock()
+
+
+async def restart_browser(dead):
+    """Replace a crashed browser with a new Chrome on the same profile, logged in with the captured session.
+
+    Batches sharing the browser may all notice the crash; only the first relaunches, the others get its browser.
+    """
+    global browser
+    async with _restart_lock:
+        if browser is not None and browser is not dead and await browser_alive(browser):
+            return browser
+        print("Chrome is gone, relaunching it", file=sys.stderr)
+        if browser is dead:
+            # Kill whatever is left of it so the profile is free again
+            await closeBrowser()
+        browser = None
+        return await get_browser()
+
+
 async def get_main_tab():
     b = await get_browser()
     if b.main_tab is None and len(b.tabs) > 0:
@@ -78,4 +190,131 @@ def set_page(new_page):
 
 def get_page():
     global page
-    return page
\ No newline at end of file
+    return page
+
+def _rss_mb(pid):
+    """Resident memory of one process in MB, None if it can't be read"""
+    try:
+        if psutil is not None:
+            return psutil.Process(pid).memory_info().rss / 2**20
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except Exception:
+        pass
+    return None
+
+
+async def sample_tab_memory(tab):
+    """JS heap and DOM size of one tab from the Performance domain"""
+    state = tab_state(tab)
+    if not state.performance_enabled:
+        await tab.send(cdp.performance.enable())
+        state.performance_enabled = True
+    metrics = {metric.name: metric.value for metric in await tab.send(cdp.performance.get_metrics()) or ()}
+    return {
+        "js_heap_mb": round(metrics.get("JSHeapUsedSize", 0) / 2**20, 1),
+        "nodes": int(metrics.get("Nodes", 0)),
+        "documents": int(metrics.get("Documents", 0)),
+        "listeners": int(metrics.get("JSEventListeners", 0)),
+        "records": state.records_done,
+    }
+
+
+async def sample_chrome_memory(b):
+    """Resident memory of every Chrome process, from SystemInfo's process list, totalled per process type"""
+    processes = await b.connection.send(cdp.system_info.get_process_info())
+    by_type = {}
+    for process in processes or ():
+        rss = _rss_mb(process.id_)
+        if rss is not None:
+            by_type[process.type_] = round(by_type.get(process.type_, 0) + rss, 1)
+    return {"total_mb": round(sum(by_type.values()), 1), "by_type": by_type, "processes": len(processes or ())}
+
+
+def needs_recycle(tab):
+    """Why a tab should be replaced before its next record, or None"""
+    state = tab_state(tab)
+    if state.recycle:
+        return state.recycle
+    if TAB_RECYCLE_RECORDS and state.records_done >= TAB_RECYCLE_RECORDS:
+        return f"{TAB_RECYCLE_RECORDS} records"
+    return None
+
+
+async def recycle_tab(tab):
+    """A fresh tab to replace a worn one; the main tab belongs to login, so it is parked on about:blank instead"""
+    fresh = await open_session_tab(tab.browser)
+    try:
+        if tab is tab.browser.main_tab:
+            state = tab_state(tab)
+            state.recycle = None
+            state.records_done = 0
+            await tab.get("about:blank")
+        else:
+            await close_session_tab(tab)
+    except Exception as e:
+        print(f"Could not release recycled tab: {e}", file=sys.stderr)
+    return fresh
+
+
+class MemoryWatchdog:
+    """Samples Chrome's memory per tab and per process while a batch runs, and flags tabs to recycle"""
+
+    def __init__(self, b, pages, report, interval=MEMORY_SAMPLE_INTERVAL):
+        self.browser = b
+        self.pages = pages  # callable returning the batch's {tab_id: tab}
+        self.report = report  # called with each sample's fields
+        self.interval = interval
+        self.samples = 0
+        self.peak_chrome_mb = 0.0
+        self.peak_tab_heap_mb = 0.0
+
+    async def sample(self):
+        tabs = {}
+        for tab_id, tab in list(self.pages().items()):
+            try:
+                tabs[tab_id] = await sample_tab_memory(tab)
+            except Exception:
+                continue
+        try:
+            chrome = await sample_chrome_memory(self.browser)
+        except Exception:
+            chrome = None
+
+        flagged = {}
+        pages = self.pages()
+        for tab_id, memory in tabs.items():
+            if TAB_MEMORY_LIMIT_MB and memory["js_heap_mb"] >= TAB_MEMORY_LIMIT_MB:
+                flagged[tab_id] = f"JS heap {memory['js_heap_mb']:.0f} MB"
+        if chrome and CHROME_MEMORY_LIMIT_MB and chrome["total_mb"] >= CHROME_MEMORY_LIMIT_MB and tabs:
+            largest = max(tabs, key=lambda tab_id: tabs[tab_id]["js_heap_mb"])
+            flagged.setdefault(largest, f"Chrome at {chrome['total_mb']:.0f} MB")
+        for tab_id, reason in flagged.items():
+            if tab_id in pages:
+                # Acted on by the tab itself between records, so the record in progress is not lost
+                tab_state(pages[tab_id]).recycle = reason
+
+        self.samples += 1
+        if chrome:
+            self.peak_chrome_mb = max(self.peak_chrome_mb, chrome["total_mb"])
+        if tabs:
+            self.peak_tab_heap_mb = max(self.peak_tab_heap_mb, max(m["js_heap_mb"] for m in tabs.values()))
+        self.report(tabs=tabs, chrome=chrome, recycle=flagged)
+
+    def summary(self):
+        return {
+            "samples": self.samples,
+            "peak_chrome_mb": round(self.peak_chrome_mb, 1),
+            "peak_tab_heap_mb": round(self.peak_tab_heap_mb, 1),
+        }
+
+    async def run(self):
+        """Sample every interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sample()
+            except Exception as e:
+                print(f"Memory sampling failed: {e}", file=sys.stderr)
@@ -0,0 +1,145 @@
+"""numTabs "auto": an AIMD controller that sizes a batch's tab pool while it runs.
+
+Every AUTO_TABS_INTERVAL seconds it looks at the last window of step
+timings and failures (metrics.BatchMetrics) and at host CPU and memory.
+If the portal is slowing down, too many steps fail, or the host is
+saturated, it shrinks the pool multiplicatively. If the window was
+healthy, it adds one tab, up to the batch's allotment from the scheduler.
+"""
+import asyncio
+import os
+import sys
+import time
+from metrics import percentile
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+AUTO_TABS_START = int(os.getenv("AUTO_TABS_START", "2"))
+AUTO_TABS_MIN = int(os.getenv("AUTO_TABS_MIN", "1"))
+AUTO_TABS_MAX = int(os.getenv("AUTO_TABS_MAX", os.getenv("MAX_TOTAL_TABS", "10")))
+AUTO_TABS_INTERVAL = float(os.getenv("AUTO_TABS_INTERVAL", "15"))
+# Share of tabs kept on a decrease: 0.5 halves the pool
+AUTO_TABS_BACKOFF = float(os.getenv("AUTO_TABS_BACKOFF", "0.7"))
+# Congestion signals: window p50 step time this many times the best seen, failures, host saturation
+AUTO_TABS_LATENCY_FACTOR = float(os.getenv("AUTO_TABS_LATENCY_FACTOR", "1.5"))
+AUTO_TABS_ERROR_RATE = float(os.getenv("AUTO_TABS_ERROR_RATE", "0.2"))
+AUTO_TABS_CPU_HIGH = float(os.getenv("AUTO_TABS_CPU_HIGH", "85"))
+AUTO_TABS_MEMORY_HIGH = float(os.getenv("AUTO_TABS_MEMORY_HIGH", "85"))
+
+
+def host_load():
+    """(cpu %, memory %) of the host, either None when unknown; CPU comes from the load average without psutil"""
+    if psutil is not None:
+        return psutil.cpu_percent(interval=None), psutil.virtual_memory().percent
+    cpu = memory = None
+    try:
+        cpu = min(100.0, os.getloadavg()[0] / (os.cpu_count() or 1) * 100)
+    except (AttributeError, OSError):
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            info = {line.split(":")[0]: int(line.split()[1]) for line in f}
+        memory = 100 * (1 - info["MemAvailable"] / info["MemTotal"])
+    except (OSError, KeyError, ValueError, IndexError):
+        pass
+    return cpu, memory
+
+
+class AutoTabController:
+    """Additive-increase / multiplicative-decrease of one batch's tab count"""
+
+    def __init__(self, batch_id, metrics, emit, start=AUTO_TABS_START, cap=AUTO_TABS_MAX, interval=AUTO_TABS_INTERVAL):
+        self.batch_id = batch_id
+        self.metrics = metrics
+        self.emit = emit  # formFiller.emit_progress
+        self.cap = max(1, cap)
+        self.tabs = max(AUTO_TABS_MIN, min(start, self.cap))
+        self.interval = interval
+        self.pool = None  # TabPool currently running the batch; set by runFormFill
+        self.best_latency = None  # lowest window p50 step time seen, the uncongested baseline
+        self._since = time.monotonic()
+        self._last_throughput = None
+        self._last_action = None
+        if psutil is not None:
+            psutil.cpu_percent(interval=None)  # the first reading only starts the measurement
+
+    def set_cap(self, cap):
+        """The scheduler changed the batch's allotment; never run more tabs than it allows"""
+        self.cap = max(1, cap)
+        if self.tabs > self.cap:
+            self._apply(self.cap, "decrease", "scheduler allotment shrank")
+
+    def attach(self, pool):
+        self.pool = pool
+        pool.set_target(self.tabs)
+
+    def _apply(self, tabs, action, reason, **signals):
+        previous, self.tabs = self.tabs, tabs
+        self._last_action = action
+        self.emit("AUTO_TABS", f"Auto tabs: {action} {previous} -> {tabs} ({reason})", self.batch_id,
+                  action=action, reason=reason, num_tabs=tabs, previous_num_tabs=previous, **signals)
+        if self.pool is not None:
+            self.pool.set_target(tabs)
+
+    def decide(self):
+        """Look at the window since the last decision and adjust the tab count"""
+        now = time.monotonic()
+        window = self.metrics.steps_since(self._since)
+        elapsed = max(now - self._since, 1e-6)
+        self._since = now
+
+        cpu, memory = host_load()
+        durations = [seconds for _, seconds, ok in window if ok]
+        failures = sum(1 for _, _, ok in window if not ok)
+        latency = percentile(durations, 50)
+        error_rate = failures / len(window) if window else 0.0
+        throughput = len(durations) * 60 / elapsed  # successful steps per minute
+        signals = {
+            "cpu": None if cpu is None else round(cpu, 1),
+            "memory": None if memory is None else round(memory, 1),
+            "step_p50": None if latency is None else round(latency, 3),
+            "baseline_p50": None if self.best_latency is None else round(self.best_latency, 3),
+            "error_rate": round(error_rate, 3),
+            "steps_per_min": round(throughput, 1),
+        }
+
+        reason = None
+        if cpu is not None and cpu >= AUTO_TABS_CPU_HIGH:
+            reason = f"host CPU at {cpu:.0f}%"
+        elif memory is not None and memory >= AUTO_TABS_MEMORY_HIGH:
+            reason = f"host memory at {memory:.0f}%"
+        elif len(window) >= self.tabs and error_rate > AUTO_TABS_ERROR_RATE:
+            reason = f"{error_rate:.0%} of steps failing"
+        elif latency is not None and self.best_latency is not None \
+                and latency > self.best_latency * AUTO_TABS_LATENCY_FACTOR:
+            reason = f"step p50 {latency:.1f}s against a best of {self.best_latency:.1f}s"
+        elif self._last_action == "increase" and self._last_throughput \
+                and throughput < self._last_throughput * 0.9:
+            reason = "the last tab added lowered throughput"
+
+        if latency is not None and not reason:
+            self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+        self._last_throughput = throughput
+
+        if reason:
+            tabs = max(AUTO_TABS_MIN, min(self.tabs - 1, int(self.tabs * AUTO_TABS_BACKOFF)))
+            if tabs < self.tabs:
+                self._apply(tabs, "decrease", reason, **signals)
+                return
+        elif len(durations) >= self.tabs and self.tabs < self.cap:
+            # Every tab finished at least a step in a healthy window: probe one more
+            self._apply(self.tabs + 1, "increase", "healthy window", **signals)
+            return
+        self._last_action = "hold"
+
+    async def run(self):
+        """Decide every interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.decide()
+            except Exception as e:
+                print(f"Auto tab controller error: {e}", file=sys.stderr)
@@ -0,0 +1,82 @@
+import asyncio
+
+
+class TaskStoppedException(Exception):
+    """Raised when task is stopped"""
+    pass
+
+
+class ControlState:
+    """Pause/stop state of one batch. Tabs wait on events rather than polling, and stop cancels their tasks"""
+
+    def __init__(self, batch_id):
+        self.batch_id = batch_id
+        self._running = asyncio.Event()  # cleared while paused
+        self._running.set()
+        self._stopped = asyncio.Event()
+        self._tasks = set()  # in-flight tab tasks, cancelled on stop
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def register(self, task):
+        """Track a tab task so stop() can cancel it wherever it is waiting"""
+        if self.stopped:
+            task.cancel()
+            return task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def stop(self):
+        self._stopped.set()
+        # Wakes paused tabs so they see the stop
+        self._running.set()
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def check(self):
+        """Raise TaskStoppedException if stopped; while paused, wait until resumed or stopped"""
+        if not self._running.is_set():
+            await self._running.wait()
+        if self.stopped:
+            raise TaskStoppedException("Task was stopped by user")
+
+    async def sleep(self, seconds):
+        """asyncio.sleep that ends early when the batch is stopped"""
+        try:
+            await asyncio.wait_for(self._stopped.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+class ControlRegistry:
+    """Control state of every batch of this worker, by batch id"""
+
+    def __init__(self):
+        self._states = {}
+
+    def create(self, batch_id):
+        state = ControlState(batch_id)
+        self._states[batch_id] = state
+        return state
+
+    def get(self, batch_id):
+        return self._states.get(batch_id)
+
+    def remove(self, batch_id):
+        self._states.pop(batch_id, None)
+
+
+control_registry = ControlRegistry()
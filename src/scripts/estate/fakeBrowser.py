@@ -0,0 +1,168 @@
+"""In-memory stand-in for the nodriver Browser/Tab API, selected with BROWSER_BACKEND=fake.
+
+Answers get, query_selector, evaluate, send and send_file instantly and
+fires the navigation events readiness.py listens for, so the whole
+runFormFill pipeline runs without Chrome. Used by profile_pipeline.py to
+measure the Python-side cost that real browser latency hides.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+from types import SimpleNamespace
+from urllib.parse import urlparse
+from nodriver import cdp
+from formSteps import form_steps
+
+# Share of continue/save clicks answered with a validation alert
+FAKE_ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))
+
+# Selectors that never match: error markers the pipeline only checks for
+ABSENT_SELECTORS = {".pf-c-alert__icon", "#input-error-otp-code"}
+ALERT_SELECTOR = "div.alert.alert-danger"
+
+FAKE_REGIONS = [
+    {"code": "1", "name": "Riyadh", "cities": [{"code": "101", "name": "Riyadh"}, {"code": "102", "name": "Diriyah"}]},
+    {"code": "2", "name": "Makkah", "cities": [{"code": "201", "name": "Jeddah"}, {"code": "202", "name": "Makkah"}]},
+]
+
+_WAIT_SELECTOR = re.compile(r"const selector = (\".*?\");\s")
+_WAIT_TIMEOUT = re.compile(r"\}, (\d+)\);\s*observer\.observe")
+_SUBMIT_SELECTORS = ("input[name='continue']", "input[type='submit'], input[name='save']", "#kc-login",
+                     "input[name='login'][type='submit']")
+
+_draft_ids = itertools.count(1000)
+
+
+class FakeElement:
+    def __init__(self, page, selector):
+        self.page = page
+        self.selector = selector
+        self.text = ""
+        self.attrs = {}
+        self.children = []
+
+    async def click(self):
+        if self.selector in _SUBMIT_SELECTORS:
+            await self.page._submit()
+
+    async def send_keys(self, text):
+        self.attrs["value"] = text
+
+    async def send_file(self, *paths):
+        self.attrs["files"] = list(paths)
+
+
+class FakeTab:
+    def __init__(self, browser, url="about:blank"):
+        self.browser = browser
+        self.url = url
+        self.closed = False
+        self.alert = False
+        self.handlers = {}  # CDP event class -> callbacks
+
+    def add_handler(self, event_type, callback):
+        self.handlers.setdefault(event_type, []).append(callback)
+
+    def _emit(self, event_type, event):
+        for callback in self.handlers.get(event_type, ()):
+            callback(event, self)
+
+    def _navigated(self, url):
+        self.url = url
+        self.alert = False
+        self._emit(cdp.page.FrameNavigated, SimpleNamespace(frame=SimpleNamespace(parent_id=None, url=url)))
+        self._emit(cdp.page.LoadEventFired, SimpleNamespace(timestamp=0))
+
+    async def send(self, cdp_obj, *args, **kwargs):
+        self.browser.cdp_calls += 1
+        return None
+
+    async def get(self, url="about:blank", new_tab=False, new_window=False):
+        if new_tab or new_window:
+            return await self.browser.get(url, new_tab=True)
+        self.browser.cdp_calls += 1
+        self._navigated(url)
+        return self
+
+    async def _submit(self):
+        """Continue/save on a form step: either a validation alert or the next page of the draft"""
+        self.browser.cdp_calls += 1
+        path = urlparse(self.url).path
+        base = self.url[: len(self.url) - len(path)] if path else self.url
+        if path.endswith("/report/create/1/137"):
+            step, draft_id = 1, next(_draft_ids)
+        elif match := re.search(r"/report/(\d+)/step/(\d+)$", path):
+            draft_id, step = int(match.group(1)), int(match.group(2))
+        else:
+            # Login and OTP buttons
+            self._navigated(f"{base}/dashboard")
+            return
+
+        if random.random() < FAKE_ERROR_RATE:
+            self.alert = True
+            return
+        if step >= len(form_steps):
+            self._navigated(f"{base}/report/{draft_id}")
+        else:
+            self._navigated(f"{base}/report/{draft_id}/step/{step + 1}")
+
+    def _matches(self, selector):
+        if selector in ABSENT_SELECTORS:
+            return False
+        if selector == ALERT_SELECTOR:
+            return self.alert
+        return not self.closed
+
+    async def query_selector(self, selector):
+        self.browser.cdp_calls += 1
+        return FakeElement(self, selector) if self._matches(selector) else None
+
+    async def evaluate(self, expression, await_promise=False, return_by_value=True):
+        self.browser.cdp_calls += 1
+        if expression == "window.location.href":
+            return self.url
+        if expression.startswith("window.__taqeem ?"):
+            if ".fill(" in expression:
+                return {"successCount": expression.count('":'), "failCount": 0, "failures": []}
+            if ".selectDynamic(" in expression:
+                return {"selected": True, "ready": True}
+            return None
+        if match := _WAIT_SELECTOR.search(expression):
+            if self._matches(json.loads(match.group(1))):
+                return True
+            # The in-page observer resolves false only once its timeout runs out
+            timeout = _WAIT_TIMEOUT.search(expression)
+            await asyncio.sleep(int(timeout.group(1)) / 1000 if timeout else 0)
+            return False
+        if "alert.alert-danger" in expression and ".remove()" in expression:
+            self.alert = False
+            return None
+        if "cities: options(city)" in expression:
+            return FAKE_REGIONS
+        return None
+
+    async def close(self):
+        self.closed = True
+        if self in self.browser.tabs:
+            self.browser.tabs.remove(self)
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.main_tab = FakeTab(self)
+        self.tabs = [self.main_tab]
+        self.stopped = False
+        self.cdp_calls = 0  # commands and evaluations sent by every tab, the fake's round trips
+
+    async def get(self, url="about:blank", new_tab=False, new_window=False):
+        if new_tab or new_window:
+            tab = FakeTab(self)
+            self.tabs.append(tab)
+            return await tab.get(url)
+        return await self.main_tab.get(url)
+
+    async def stop(self):
+        self.stopped = True
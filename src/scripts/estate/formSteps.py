@@ -76,6 +76,12 @@ field_types_2 = {
     "city": "location",
 }
 
+# Fields a dynamic_select renders or repopulates after it changes; fill_form waits for them
+dynamic_dependents_2 = {
+    "asset_type": ["[name='asset_usage_id']"],
+    "asset_usage_sector": [],
+}
+
 field_map_3 = {
     "block_number": "[name='attribute[1]']",
     "property_number": "[name='attribute[2]']",
@@ -132,6 +138,6 @@ field_types_3 = {
 
 form_steps = [
     {"field_map": field_map_1, "field_types": field_types_1},
-    {"field_map": field_map_2, "field_types": field_types_2},
+    {"field_map": field_map_2, "field_types": field_types_2, "dynamic_dependents": dynamic_dependents_2},
     {"field_map": field_map_3, "field_types": field_types_3},
 ]
\ No newline at end of file
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from formSteps import form_steps
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+client = AsyncIOMotorClient(MONGO_URI)
+db = client[os.getenv("MONGO_DB", "projectForever")]
+
+
+class FormWriter:
+    """Write-behind buffer that turns per-record updates into periodic bulk_write calls"""
+
+    def __init__(self, collection, max_batch=50, max_delay=2.0):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = {}  # _id -> fields to $set, later updates merged over earlier ones
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    def set(self, record_id, fields):
+        """Queue a $set for a record; returns immediately"""
+        self._ensure_started()
+        self._pending.setdefault(record_id, {}).update(fields)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything buffered so far; failed writes stay buffered for the next flush"""
+        if self._flush_lock is None:
+            return True
+        async with self._flush_lock:
+            if not self._pending:
+                return True
+            batch, self._pending = self._pending, {}
+            try:
+                await self.collection.bulk_write(
+                    [UpdateOne({"_id": record_id}, {"$set": fields}) for record_id, fields in batch.items()],
+                    ordered=False
+                )
+                return True
+            except Exception as e:
+                print(f"Bulk write of {len(batch)} records failed: {e}", file=sys.stderr)
+                for record_id, fields in batch.items():
+                    # Anything queued while we were writing is newer and wins
+                    self._pending[record_id] = {**fields, **self._pending.get(record_id, {})}
+                return False
+
+    async def drain(self, attempts=3, delay=1.0):
+        """Flush until the buffer is empty, retrying failed writes; False if something is still unwritten"""
+        for attempt in range(attempts):
+            if await self.flush():
+                return True
+            if attempt < attempts - 1:
+                await asyncio.sleep(delay)
+        return not self._pending
+
+    def unwritten(self, record_ids):
+        """Those of the records whose saved form_id has not reached Mongo yet"""
+        return [record_id for record_id in record_ids if "form_id" in self._pending.get(record_id, {})]
+
+    async def close(self, attempts=3):
+        """Stop the background flusher and drain the buffer"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if await self.drain(attempts):
+            return True
+        print(f"Dropping {len(self._pending)} unwritten record updates: {[str(i) for i in self._pending]}",
+              file=sys.stderr)
+        return False
+
+
+form_writer = FormWriter(
+    db.taqeemForms,
+    max_batch=int(os.getenv("FORM_WRITE_BATCH", "50")),
+    max_delay=float(os.getenv("FORM_WRITE_INTERVAL", "2"))
+)
+
+
+# Only the fields the form actually fills are ever loaded
+FORM_FIELDS = sorted({key for step in form_steps for key in step["field_map"]})
+# Step checkpoint written by formFiller.save_checkpoint, used to resume a record mid-form
+CHECKPOINT_FIELDS = ["draft_url", "draft_id", "last_step"]
+PENDING_FILTER = {"form_id": {"$in": [None, ""]}}
+
+_indexes_ready = False
+
+async def ensure_indexes():
+    """Create the (batch_id, form_id) index the pending-record queries rely on, once per process"""
+    global _indexes_ready
+    if not _indexes_ready:
+        await db.taqeemForms.create_index([("batch_id", 1), ("form_id", 1)])
+        _indexes_ready = True
+
+def _pending_query(batch_id, shard=None):
+    query = {"batch_id": batch_id, **PENDING_FILTER}
+    if shard:
+        # Supervisor mode: each worker process takes the rows congruent to its index
+        query["row_number"] = {"$mod": [shard["count"], shard["index"]]}
+    return query
+
+async def count_pending_records(batch_id, shard=None):
+    return await db.taqeemForms.count_documents(_pending_query(batch_id, shard))
+
+def stream_pending_records(batch_id, shard=None):
+    """Cursor over the batch's records that have no form_id yet, projected to the form fields"""
+    return db.taqeemForms.find(
+        _pending_query(batch_id, shard),
+        projection={key: 1 for key in FORM_FIELDS + CHECKPOINT_FIELDS}
+    )
@@ -0,0 +1,534 @@
+"""Direct HTTP submission of the create-report steps, next to the browser path.
+
+With SUBMIT_BACKEND=http a record's three steps are posted straight to the
+portal from a pooled aiohttp client that carries the logged-in browser's
+cookies (session.get_session). Each step's form is fetched first: its
+hidden fields (the CSRF _token among them) and defaults are kept, the
+record's values go on top, and the form is posted with the report PDF as
+a multipart upload, the way the browser would submit it.
+
+Before posting, the page must have every field formSteps.py addresses.
+If it doesn't, or if a value has no matching option, the portal rejects
+a step, or the answer is not the expected redirect, HttpFallback is raised
+and the record continues on the browser path from the last checkpoint.
+A rejected last step falls back the same way. But if the save is lost in
+transit, times out, gets a 5xx, or is accepted without a form id, the
+report may already exist: SaveUnconfirmed is raised and the record is
+failed instead.
+Form-structure mismatches also switch the engine off for
+HTTP_SUBMIT_COOLDOWN seconds, since every other record would miss the same
+way. Needs the optional `aiohttp` package; without it records always go
+through the browser.
+"""
+import asyncio
+import mimetypes
+import os
+import re
+import sys
+import time
+from html.parser import HTMLParser
+from http.cookies import SimpleCookie
+from urllib.parse import urljoin, urlparse
+from formSteps import form_steps
+from formStore import form_writer
+from browser import FORM_URL, PORTAL_BASE_URL
+from session import get_session
+from injection import step_values
+from locationCatalog import location_catalog
+from retry import PortalFailure, classify, url_failure, NAVIGATION, PORTAL_ERROR, SESSION_EXPIRED, UNKNOWN
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:
+    aiohttp = None
+
+# "browser" (default) fills every step in a tab; "http" posts the forms directly and uses the tab only as fallback.
+# "http" needs aiohttp (in requirements.txt); where it is missing the worker warns and stays on the browser
+SUBMIT_BACKEND = os.getenv("SUBMIT_BACKEND", "browser").lower()
+# Connections the shared client keeps open to the portal, across every tab and batch of the worker
+HTTP_SUBMIT_CONNECTIONS = int(os.getenv("HTTP_SUBMIT_CONNECTIONS", "20"))
+HTTP_SUBMIT_TIMEOUT = float(os.getenv("HTTP_SUBMIT_TIMEOUT", "60"))
+# After the portal's forms stop matching formSteps.py, records go through the browser for this long
+HTTP_SUBMIT_COOLDOWN = float(os.getenv("HTTP_SUBMIT_COOLDOWN", "600"))
+
+# Special field types whose values step_values leaves out
+_DYNAMIC, _LOCATION, _FILE = "dynamic_select", "location", "file"
+_SELECTOR = re.compile(r"\[(name|id)='(.+)'\]")
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class HttpFallback(Exception):
+    """The record has to continue in the browser; `structural` when the form itself no longer matches"""
+
+    def __init__(self, message, structural=False):
+        super().__init__(message)
+        self.structural = structural
+
+
+class SaveUnconfirmed(PortalFailure):
+    """The last step was posted but no answer confirmed or rejected it; never retried"""
+
+    save_sent = True
+
+    def __init__(self, error):
+        super().__init__(classify(error), f"Save was posted but not confirmed: {error}")
+
+
+class _Control:
+    """One named input, select or textarea of the form, with the name/id keys it can be addressed by"""
+
+    def __init__(self, tag, attrs, keys):
+        self.tag = tag
+        self.attrs = attrs
+        self.name = attrs.get("name")
+        self.id = attrs.get("id")
+        self.type = (attrs.get("type") or ("text" if tag == "input" else tag)).lower()
+        self.keys = keys  # ("name"|"id", value) of the control and of every element around it
+        self.value = attrs.get("value", "") if tag == "input" else ""
+        self.checked = "checked" in attrs
+        self.options = []  # select: [value, text, selected]
+        self.file = None  # file input: path to upload
+
+    def selected(self):
+        """Value the browser would send for a select: the selected option, else the first"""
+        chosen = [o for o in self.options if o[2]] or self.options[:1]
+        return chosen[0][0] if chosen else None
+
+
+class _FormParser(HTMLParser):
+    """Controls of the page's step form, plus the labels and error markers around them"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.forms = []  # {"action", "enctype", "controls"}
+        self.labels = {}  # label for= -> text
+        self.meta = {}
+        # Feedback texts are often always in the markup, so only the alert and the field classes count
+        self.alert = False
+        self.invalid = False
+        self._stack = []  # (tag, attrs) of open elements
+        self._form = None
+        self._option = None
+        self._textarea = None
+        self._label = None  # [for, text]
+
+    def _keys(self, attrs):
+        keys = set()
+        for _, outer in self._stack:
+            keys.update((kind, outer[kind]) for kind in ("name", "id") if outer.get(kind))
+        keys.update((kind, attrs[kind]) for kind in ("name", "id") if attrs.get(kind))
+        return keys
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {key: value if value is not None else "" for key, value in attrs}
+        classes = attrs.get("class", "").split()
+        if "alert-danger" in classes:
+            self.alert = True
+        if "is-invalid" in classes or attrs.get("aria-invalid") == "true":
+            self.invalid = True
+        if tag == "meta" and attrs.get("name"):
+            self.meta[attrs["name"]] = attrs.get("content", "")
+        elif tag == "form":
+            self._form = {"action": attrs.get("action", ""), "enctype": attrs.get("enctype", ""), "controls": []}
+            self.forms.append(self._form)
+        elif tag == "label":
+            self._label = [attrs.get("for"), ""]
+        elif tag in ("input", "select", "textarea", "button") and self._form is not None:
+            control = _Control(tag, attrs, self._keys(attrs))
+            if tag == "button":
+                control.type = (attrs.get("type") or "submit").lower()
+                control.value = attrs.get("value", "")
+            self._form["controls"].append(control)
+            if tag == "textarea":
+                self._textarea = control
+        elif tag == "option" and self._form is not None and self._form["controls"]:
+            select = self._form["controls"][-1]
+            if select.tag == "select":
+                self._option = [attrs.get("value"), "", "selected" in attrs]
+                select.options.append(self._option)
+        if tag not in _VOID_TAGS:
+            self._stack.append((tag, attrs))
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+        elif tag == "option" and self._option is not None:
+            self._option[1] = self._option[1].strip()
+            if self._option[0] is None:
+                self._option[0] = self._option[1]
+            self._option = None
+        elif tag == "textarea":
+            self._textarea = None
+        elif tag == "label" and self._label:
+            if self._label[0]:
+                self.labels[self._label[0]] = self._label[1].strip()
+            self._label = None
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                del self._stack[index:]
+                break
+
+    def handle_data(self, data):
+        if self._option is not None:
+            self._option[1] += data
+        if self._textarea is not None:
+            self._textarea.value += data
+        if self._label is not None:
+            self._label[1] += data
+
+
+class StepForm:
+    """The parsed form of one create-report step, filled in memory and turned into a request body"""
+
+    def __init__(self, url, html):
+        parser = _FormParser()
+        parser.feed(html)
+        parser.close()
+        self.url = url
+        self.labels = parser.labels
+        self.csrf = parser.meta.get("csrf-token")
+        self.rejected = parser.alert or parser.invalid
+        # The step form is the one with the portal's continue/save button
+        self.form = next((f for f in parser.forms if self._button(f["controls"])), None)
+        self.controls = self.form["controls"] if self.form else []
+        self.action = urljoin(url, self.form["action"]) if self.form else url
+
+    @staticmethod
+    def _button(controls):
+        return next((c for c in controls if c.type == "submit" and c.name in ("continue", "save")), None)
+
+    @property
+    def button(self):
+        return self._button(self.controls)
+
+    def find(self, selector, tag=None):
+        """Controls a formSteps selector addresses: by their own name/id or that of an element around them"""
+        match = _SELECTOR.fullmatch(selector)
+        if not match:
+            return []
+        key = match.groups()
+        return [c for c in self.controls if key in c.keys and (tag is None or c.tag == tag)]
+
+    def missing(self, step_num):
+        """Keys of the step's fields this page does not have"""
+        return [key for key, selector in form_steps[step_num - 1]["field_map"].items() if not self.find(selector)]
+
+    def set_text(self, selector, value):
+        controls = [c for c in self.find(selector) if c.type not in ("radio", "checkbox", "file")]
+        if not controls:
+            raise HttpFallback(f"no text field at {selector}")
+        controls[0].value = value
+
+    def set_select(self, selector, value, by_text=True):
+        """Pick the option whose value (or text) matches; a select filled over AJAX takes the value as is"""
+        controls = self.find(selector, "select")
+        if not controls:
+            raise HttpFallback(f"no select at {selector}")
+        select = controls[0]
+        if not select.options or not any(o[0] for o in select.options):
+            select.options = [[value, value, True]]
+            return
+        for option in select.options:
+            if option[0] == value or (by_text and option[1] == value):
+                for other in select.options:
+                    other[2] = other is option
+                return
+        raise HttpFallback(f"{value!r} is not an option of {selector}")
+
+    def set_checkbox(self, selector, value):
+        controls = [c for c in self.find(selector) if c.type == "checkbox"]
+        if not controls:
+            raise HttpFallback(f"no checkbox at {selector}")
+        # The browser runtime checks the first box the selector finds whenever the value is non-empty
+        controls[0].checked = bool(value)
+
+    def set_radio(self, selector, value):
+        """Check the radio of the group whose label reads `value`"""
+        radios = [c for c in self.find(selector) if c.type == "radio"]
+        chosen = [c for c in radios if c.id and self.labels.get(c.id) == value]
+        if len(chosen) != 1:
+            raise HttpFallback(f"no single {value!r} option at {selector}")
+        for radio in self.controls:
+            if radio.type == "radio" and radio.name == chosen[0].name:
+                radio.checked = radio is chosen[0]
+
+    def set_file(self, selector, path):
+        controls = [c for c in self.find(selector) if c.type == "file"]
+        if not controls:
+            raise HttpFallback(f"no file input at {selector}")
+        if not os.path.isfile(path):
+            raise HttpFallback(f"file {path!r} not found")
+        controls[0].file = path
+
+    def fields(self):
+        """(name, value) pairs the browser would submit on clicking the step's button; files as paths"""
+        pairs, files = [], []
+        button = self.button
+        for control in self.controls:
+            if not control.name or "disabled" in control.attrs:
+                continue
+            if control.type in ("submit", "button", "reset", "image"):
+                if control is button:
+                    pairs.append((control.name, control.value))
+            elif control.type in ("checkbox", "radio"):
+                if control.checked:
+                    pairs.append((control.name, control.value or "on"))
+            elif control.type == "file":
+                if control.file:
+                    files.append((control.name, control.file))
+            elif control.tag == "select":
+                value = control.selected()
+                if value is not None:
+                    pairs.append((control.name, value))
+            else:
+                pairs.append((control.name, control.value))
+        return pairs, files
+
+
+def fill_step(form, record, step_num):
+    """Put the record's values for one step into the parsed form, the way fill_step_fields does in a tab"""
+    step = form_steps[step_num - 1]
+    field_map, field_types = step["field_map"], step["field_types"]
+
+    for key, value in step_values(record, step_num - 1).items():
+        selector, field_type = field_map[key], field_types.get(key, "text")
+        if field_type == "select":
+            form.set_select(selector, value)
+        elif field_type == "checkbox":
+            form.set_checkbox(selector, value)
+        elif field_type == "radio":
+            form.set_radio(selector, value)
+        else:
+            form.set_text(selector, value)
+
+    location_done = False
+    for key, selector in field_map.items():
+        if key not in record:
+            continue
+        field_type = field_types.get(key, "text")
+        value = str(record[key] or "").strip()
+        if field_type == _DYNAMIC and value:
+            form.set_select(selector, value, by_text=False)
+        elif field_type == _FILE and value:
+            form.set_file(selector, value)
+        elif field_type == _LOCATION and not location_done:
+            location_done = True
+            # The codes come from the shared catalog; without it the dropdowns need the page's AJAX
+            region_code, city_code = location_catalog.lookup(record.get("region", ""), record.get("city", ""))
+            if not (region_code and city_code):
+                raise HttpFallback("location not in the catalog")
+            form.set_select(field_map["country"], "1", by_text=False)
+            form.set_select(field_map["region"], str(region_code), by_text=False)
+            form.set_select(field_map["city"], str(city_code), by_text=False)
+
+
+def _checkpoint(record, draft_url, step_num):
+    """Same checkpoint the browser path writes, so either path can resume the other's draft"""
+    record["draft_url"] = draft_url
+    record["draft_id"] = draft_url.rstrip("/").split("/")[-1]
+    record["last_step"] = step_num
+    form_writer.set(record["_id"], {
+        "draft_url": record["draft_url"],
+        "draft_id": record["draft_id"],
+        "last_step": step_num
+    })
+
+
+class HttpSubmitter:
+    """Worker-wide pooled HTTP client that submits records without a tab"""
+
+    def __init__(self, backend=SUBMIT_BACKEND):
+        self.backend = backend
+        self.disabled_until = 0.0
+        self.submitted = 0
+        self.fallbacks = 0
+        self._client = None
+        self._captured_at = None
+        self._warned = False
+
+    @property
+    def enabled(self):
+        if self.backend != "http":
+            return False
+        if aiohttp is None:
+            if not self._warned:
+                self._warned = True
+                print("SUBMIT_BACKEND=http needs the aiohttp package; submitting through the browser", file=sys.stderr)
+            return False
+        return time.monotonic() >= self.disabled_until
+
+    def _cookie_jar(self, session):
+        """aiohttp jar seeded with the session's cookies for the portal host"""
+        jar = aiohttp.CookieJar(unsafe=True)  # unsafe: also keep cookies of an IP host, e.g. the stand-in
+        portal = urlparse(PORTAL_BASE_URL)
+        host = portal.hostname or ""
+        for cookie in session["cookies"]:
+            domain = (cookie.get("domain") or host).lstrip(".")
+            if host != domain and not host.endswith("." + domain):
+                continue
+            morsel = SimpleCookie()
+            morsel[cookie["name"]] = cookie["value"]
+            morsel[cookie["name"]]["path"] = cookie.get("path") or "/"
+            if (cookie.get("domain") or "").startswith("."):
+                morsel[cookie["name"]]["domain"] = cookie["domain"]
+            jar.update_cookies(morsel, URL(PORTAL_BASE_URL))
+        return jar
+
+    async def _get_client(self):
+        """The shared client, rebuilt whenever a new login replaced the session"""
+        session = get_session()
+        if not session:
+            raise HttpFallback("no captured session")
+        if self._client is None or self._client.closed or session.get("captured_at") != self._captured_at:
+            headers = {"Origin": PORTAL_BASE_URL}
+            if session.get("user_agent"):
+                headers["User-Agent"] = session["user_agent"]
+            # Swapped in before the old one is closed, so concurrent callers never build a second client
+            old, self._client = self._client, aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=HTTP_SUBMIT_CONNECTIONS),
+                cookie_jar=self._cookie_jar(session),
+                timeout=aiohttp.ClientTimeout(total=HTTP_SUBMIT_TIMEOUT),
+                headers=headers,
+            )
+            self._captured_at = session.get("captured_at")
+            if old is not None and not old.closed:
+                await old.close()
+        return self._client
+
+    async def _request(self, method, url, **kwargs):
+        """(final url, status, html, redirected) of a request, with redirects followed"""
+        try:
+            client = await self._get_client()
+            async with client.request(method, url, **kwargs) as response:
+                html = await response.text(errors="replace")
+                final_url, status, redirected = str(response.url), response.status, bool(response.history)
+        except aiohttp.ClientError as e:
+            raise PortalFailure(NAVIGATION, f"{method} {url} failed: {e}") from e
+        if status >= 500:
+            raise PortalFailure(PORTAL_ERROR, f"Portal returned HTTP {status} for {url}")
+        if url_failure(final_url):
+            raise PortalFailure(SESSION_EXPIRED, f"Portal redirected to {final_url}; the session is gone")
+        if status >= 400:
+            # 419 is an expired CSRF token; the browser path reloads the form and carries on
+            raise HttpFallback(f"Portal returned HTTP {status} for {url}")
+        return final_url, status, html, redirected
+
+    async def _open(self, record):
+        """The form of the step to fill next: the checkpointed draft's next step, or a new report"""
+        last_step = record.get("last_step") or 0
+        if record.get("draft_url") and 0 < last_step < len(form_steps):
+            url, _, html, _ = await self._request("GET", record["draft_url"])
+            form = StepForm(url, html)
+            # Only trust the draft if the portal shows its next step, not a redirect back to step 1
+            if form.button and not form.missing(last_step + 1):
+                return form, last_step + 1
+        url, _, html, _ = await self._request("GET", FORM_URL)
+        return StepForm(url, html), 1
+
+    def _body(self, form):
+        pairs, files = form.fields()
+        if not files and "multipart" not in form.form["enctype"]:
+            return aiohttp.FormData(pairs), []
+        writer = aiohttp.MultipartWriter("form-data")
+        for name, value in pairs:
+            writer.append(value).set_content_disposition("form-data", name=name)
+        handles = []
+        for name, path in files:
+            handle = open(path, "rb")
+            handles.append(handle)
+            content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            part = writer.append(handle, {"Content-Type": content_type})
+            part.set_content_disposition("form-data", name=name, filename=os.path.basename(path))
+        return writer, handles
+
+    async def _post(self, form):
+        body, handles = self._body(form)
+        headers = {"Referer": form.url}
+        if form.csrf:
+            headers["X-CSRF-TOKEN"] = form.csrf
+        try:
+            return await self._request("POST", form.action, data=body, headers=headers)
+        finally:
+            for handle in handles:
+                handle.close()
+
+    async def _post_step(self, form, record, step_num, metrics=None):
+        """Post one filled step; the next step's form, or the saved form id after the last step"""
+        started = time.monotonic()
+        url, _, html, redirected = await self._post(form)
+        next_form = StepForm(url, html)
+        # Laravel answers a rejected step by redirecting back to it with the fields flagged
+        ok = redirected and not next_form.rejected and url.rstrip("/") not in (form.url.rstrip("/"), form.action.rstrip("/"))
+        if metrics:
+            metrics.record_step(step_num, time.monotonic() - started, ok=ok)
+        if not ok:
+            # Rejected or not understood: the browser redoes the step and retries what the portal flags
+            raise HttpFallback(f"portal did not accept step {step_num}")
+
+        if step_num < len(form_steps):
+            _checkpoint(record, url, step_num)
+            return next_form
+        form_id = url.rstrip("/").split("/")[-1]
+        if not form_id:
+            # Accepted, so the report may well exist; only its id is missing
+            raise SaveUnconfirmed(PortalFailure(UNKNOWN, "no form id after saving"))
+        # Written behind by form_writer, as on the browser path
+        form_writer.set(record["_id"], {"form_id": form_id, "last_step": len(form_steps)})
+        record["form_id"] = form_id
+        return form_id
+
+    def _disable(self, reason):
+        self.disabled_until = time.monotonic() + HTTP_SUBMIT_COOLDOWN
+        print(f"HTTP submission off for {HTTP_SUBMIT_COOLDOWN:.0f}s: {reason}", file=sys.stderr)
+
+    async def submit(self, record, on_step=None, metrics=None):
+        """Post the record's remaining steps; returns the saved form id.
+
+        Raises HttpFallback when the record has to continue in the browser
+        (its checkpoint already covers the steps posted here), PortalFailure
+        for failures the browser would hit just the same, and SaveUnconfirmed
+        when the last step was posted but its answer was lost, a 5xx or without a form id.
+        on_step(step_num, is_last_step) is called before each step is posted.
+        """
+        try:
+            form, step_num = await self._open(record)
+            while True:
+                is_last_step = step_num == len(form_steps)
+                missing = form.missing(step_num)
+                if not form.button or missing:
+                    raise HttpFallback(f"step {step_num} form does not match formSteps.py (missing {missing or 'button'})",
+                                       structural=True)
+                fill_step(form, record, step_num)
+                if on_step:
+                    on_step(step_num, is_last_step)
+
+                post = self._post_step(form, record, step_num, metrics)
+                if not is_last_step:
+                    form, step_num = await post, step_num + 1
+                    continue
+                try:
+                    # Once the save is sent, a stop must not cancel it before the form id is recorded
+                    form_id = await asyncio.shield(post)
+                except (asyncio.TimeoutError, PortalFailure) as e:
+                    if isinstance(e, SaveUnconfirmed) or getattr(e, "failure_class", None) == SESSION_EXPIRED:
+                        # Already judged, or bounced to the login page before anything was saved
+                        raise
+                    # Lost on the wire, timed out or a 5xx: the report may exist now, so the record
+                    # must not be saved again by the browser or the retry queue
+                    raise SaveUnconfirmed(e) from e
+                self.submitted += 1
+                return form_id
+        except HttpFallback as e:
+            self.fallbacks += 1
+            if e.structural:
+                self._disable(e)
+            raise
+
+    async def close(self):
+        if self._client is not None and not self._client.closed:
+            await self._client.close()
+        self._client = None
+
+
+http_submitter = HttpSubmitter()
@@ -0,0 +1,229 @@
+import json
+import sys
+from datetime import datetime
+from nodriver import cdp
+from tabState import tab_state
+from formSteps import form_steps
+
+# Field types filled by their own phase in fill_form rather than by bulk injection
+SPECIAL_FIELD_TYPES = ("dynamic_select", "location", "file")
+
+# Selector and type of every bulk-injected field, per step, baked into the tab once
+STEP_FIELDS = [
+    {
+        key: {"selector": selector, "type": step["field_types"].get(key, "text")}
+        for key, selector in step["field_map"].items()
+        if step["field_types"].get(key, "text") not in SPECIAL_FIELD_TYPES
+    }
+    for step in form_steps
+]
+
+# Selector of every field, special ones included, per step; used to find the fields the portal flagged
+STEP_SELECTORS = [dict(step["field_map"]) for step in form_steps]
+
+_RUNTIME_JS = """
+(function() {
+    if (window.__taqeem) return;
+    const steps = __STEPS__;
+    const selectors = __SELECTORS__;
+
+    const fireChange = (el, withInput) => {
+        if (withInput) el.dispatchEvent(new Event("input", { bubbles: true }));
+        el.dispatchEvent(new Event("change", { bubbles: true }));
+    };
+
+    const setValue = (el, type, value) => {
+        switch (type) {
+            case "checkbox":
+                el.checked = Boolean(value);
+                fireChange(el, false);
+                break;
+
+            case "select": {
+                let found = false;
+                for (const opt of el.options) {
+                    if (opt.value == value || opt.text == value) {
+                        el.value = opt.value;
+                        found = true;
+                        break;
+                    }
+                }
+                if (!found && el.options.length) {
+                    el.selectedIndex = 0;
+                }
+                fireChange(el, false);
+                break;
+            }
+
+            case "radio":
+                for (const lbl of document.querySelectorAll('label.form-check-label')) {
+                    if ((lbl.innerText || '').trim() === value) {
+                        const radio = document.getElementById(lbl.getAttribute('for'));
+                        if (radio) {
+                            radio.checked = true;
+                            fireChange(radio, false);
+                            break;
+                        }
+                    }
+                }
+                break;
+
+            case "date":
+            case "text":
+            default:
+                el.value = value ?? "";
+                fireChange(el, true);
+                break;
+        }
+    };
+
+    window.__taqeem = {
+        fill(stepIndex, values) {
+            let successCount = 0;
+            let failCount = 0;
+            const failures = [];
+
+            for (const [key, value] of Object.entries(values)) {
+                const meta = steps[stepIndex][key];
+                if (!meta) continue;
+                const el = document.querySelector(meta.selector);
+                if (!el) {
+                    failures.push({selector: meta.selector, reason: 'Element not found'});
+                    failCount++;
+                    continue;
+                }
+                try {
+                    setValue(el, meta.type, value);
+                    successCount++;
+                } catch (err) {
+                    failures.push({selector: meta.selector, reason: err.message});
+                    failCount++;
+                }
+            }
+
+            return {successCount, failCount, failures};
+        },
+
+        // Waits for the option to exist, selects it, then waits for the fields the change unlocks
+        selectDynamic(selector, value, dependents, timeoutMs) {
+            const optionOf = () => {
+                const el = document.querySelector(selector);
+                if (!el) return null;
+                return Array.from(el.options || []).find((opt) => opt.value == value) || null;
+            };
+            const dependentsReady = () => dependents.every((dep) => {
+                const el = document.querySelector(dep);
+                return el && (el.tagName !== 'SELECT' || el.options.length > 1);
+            });
+            const whenTrue = (check) => new Promise((resolve) => {
+                if (check()) return resolve(true);
+                const observer = new MutationObserver(() => {
+                    if (check()) { observer.disconnect(); clearTimeout(timer); resolve(true); }
+                });
+                const timer = setTimeout(() => { observer.disconnect(); resolve(false); }, timeoutMs);
+                observer.observe(document.documentElement, { childList: true, subtree: true, attributes: true });
+            });
+
+            return whenTrue(() => optionOf() !== null).then((found) => {
+                if (!found) return {selected: false, ready: false};
+                const el = document.querySelector(selector);
+                el.value = optionOf().value;
+                if (window.$) {
+                    window.$(el).trigger("change");
+                } else {
+                    fireChange(el, true);
+                }
+                return whenTrue(dependentsReady).then((ready) => ({selected: true, ready}));
+            });
+        },
+
+        // Keys of the step's fields marked invalid after a rejected submit
+        flagged(stepIndex) {
+            const keys = [];
+            for (const [key, selector] of Object.entries(selectors[stepIndex])) {
+                const el = document.querySelector(selector);
+                if (!el) continue;
+                const group = el.closest('.form-group') || el.parentElement;
+                // Feedback elements are often always in the markup; only a visible, non-empty one counts
+                const marker = group && group.querySelector('.is-invalid, .invalid-feedback, .text-danger');
+                const shown = marker && (marker.classList.contains('is-invalid') ||
+                    (marker.offsetParent !== null && (marker.textContent || '').trim()));
+                if (el.classList.contains('is-invalid') || el.getAttribute('aria-invalid') === 'true' || shown) {
+                    keys.push(key);
+                }
+            }
+            return keys;
+        },
+
+        setField(selector, value) {
+            if (window.$) {
+                window.$(selector).val(value).trigger("change");
+                return;
+            }
+            const el = document.querySelector(selector);
+            if (!el) return;
+            if (el.value !== value) {
+                el.value = value;
+                fireChange(el, true);
+            }
+        }
+    };
+})();
+"""
+
+INJECTION_SOURCE = (
+    _RUNTIME_JS
+    .replace("__STEPS__", json.dumps(STEP_FIELDS))
+    .replace("__SELECTORS__", json.dumps(STEP_SELECTORS))
+)
+
+
+async def install_injection(page):
+    """Register the fill runtime on the tab once; every later document gets it before its own scripts run"""
+    state = tab_state(page)
+    if state.injection_installed:
+        return
+    await page.send(cdp.page.add_script_to_evaluate_on_new_document(source=INJECTION_SOURCE))
+    await page.evaluate(INJECTION_SOURCE)
+    state.injection_installed = True
+
+
+async def call_runtime(page, expression, await_promise=False):
+    """Evaluate a window.__taqeem call, installing the runtime first if this document lacks it"""
+    await install_injection(page)
+    guarded = f"window.__taqeem ? {expression} : '__missing__'"
+    result = await page.evaluate(guarded, await_promise=await_promise, return_by_value=True)
+    if result == "__missing__":
+        # Document created before registration took effect
+        await page.evaluate(INJECTION_SOURCE)
+        result = await page.evaluate(guarded, await_promise=await_promise, return_by_value=True)
+    return result
+
+
+def step_values(record, step_index):
+    """The record's values for one step's bulk fields, with dates in the form's format"""
+    values = {}
+    for key, meta in STEP_FIELDS[step_index].items():
+        if key not in record:
+            continue
+
+        value = str(record[key] or "").strip()
+
+        if meta["type"] == "date" and value:
+            try:
+                value = datetime.strptime(value, "%d-%m-%Y").strftime("%Y-%m-%d")
+            except ValueError:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    print(f"[WARNING] Invalid date format for {key}: {value}", file=sys.stderr)
+                    continue
+
+        values[key] = value
+    return values
+
+
+async def flagged_fields(page, step_num):
+    """Keys of the step's fields the portal marked invalid; empty when it flagged none it could point at"""
+    result = await call_runtime(page, f"window.__taqeem.flagged({step_num - 1})")
+    return set(result) if isinstance(result, list) else set()
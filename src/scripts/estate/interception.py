@@ -0,0 +1,187 @@
+import base64
+import fnmatch
+import os
+import sys
+from collections import OrderedDict
+from dotenv import load_dotenv
+from nodriver import cdp
+from tabState import tab_state
+
+load_dotenv()
+
+
+def _env_list(name, default=""):
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+# Opt-in: with it off tabs load pages exactly as before
+RESOURCE_BLOCKING = os.getenv("RESOURCE_BLOCKING", "false").lower() in ("true", "1", "yes")
+BLOCK_RESOURCE_TYPES = set(_env_list("BLOCK_RESOURCE_TYPES", "Image,Font,Media"))
+BLOCK_URL_PATTERNS = _env_list(
+    "BLOCK_URL_PATTERNS",
+    "*google-analytics.com*,*googletagmanager.com*,*doubleclick.net*,*hotjar.com*,*facebook.net*,*clarity.ms*"
+)
+# Checked first: a URL matching one of these is never blocked
+ALLOW_URL_PATTERNS = _env_list("ALLOW_URL_PATTERNS")
+# GET responses of these types are kept in memory and replayed to every tab
+CACHE_RESOURCE_TYPES = set(_env_list("CACHE_RESOURCE_TYPES", "Script,Stylesheet"))
+CACHE_MAX_BYTES = int(os.getenv("RESOURCE_CACHE_MB", "32")) * 1024 * 1024
+
+
+def _size_estimates(name, default):
+    estimates = {}
+    for item in _env_list(name, default):
+        try:
+            resource_type, kb = item.split(":", 1)
+            estimates[resource_type.strip()] = float(kb)
+        except ValueError:
+            print(f"Ignoring malformed {name} entry {item!r}", file=sys.stderr)
+    return estimates
+
+
+# Blocked requests never get a response, so their size is unknown: "type:KB" guesses counted as
+# bytes_blocked_estimate, kept apart from bytes_saved which only counts bytes actually replayed
+BLOCKED_SIZE_ESTIMATES_KB = _size_estimates("BLOCKED_SIZE_ESTIMATES_KB", "Image:40,Font:60,Media:500,Other:20")
+
+
+def _matches(url, patterns):
+    return any(fnmatch.fnmatchcase(url, pattern) for pattern in patterns)
+
+
+class ResponseCache:
+    """Static responses shared by every tab, evicted least recently used past max_bytes"""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # url -> (status, headers, base64 body, raw size)
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry:
+            self._entries.move_to_end(url)
+        return entry
+
+    def put(self, url, status, headers, body, size):
+        if size > self.max_bytes // 4:
+            return
+        if url in self._entries:
+            self.size -= self._entries.pop(url)[3]
+        self._entries[url] = (status, headers, body, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted[3]
+
+
+response_cache = ResponseCache()
+
+
+class PageInterception:
+    """Fetch-domain request interception of one tab, with counters of what it saved"""
+
+    def __init__(self, page, cache=response_cache):
+        self.page = page
+        self.cache = cache
+        self.blocked = 0
+        self.served_from_cache = 0
+        self.bytes_saved = 0  # bytes replayed from the cache instead of downloaded
+        self.bytes_blocked_estimate = 0  # guessed size of blocked requests, see BLOCKED_SIZE_ESTIMATES_KB
+        self.passed = 0
+
+    async def enable(self):
+        patterns = [cdp.fetch.RequestPattern(url_pattern="*", request_stage=cdp.fetch.RequestStage.REQUEST)]
+        patterns += [
+            cdp.fetch.RequestPattern(
+                url_pattern="*",
+                resource_type=cdp.network.ResourceType.from_json(resource_type),
+                request_stage=cdp.fetch.RequestStage.RESPONSE
+            )
+            for resource_type in CACHE_RESOURCE_TYPES
+        ]
+        self.page.add_handler(cdp.fetch.RequestPaused, self._on_paused)
+        await self.page.send(cdp.fetch.enable(patterns=patterns))
+
+    def should_block(self, url, resource_type):
+        if _matches(url, ALLOW_URL_PATTERNS):
+            return False
+        return resource_type in BLOCK_RESOURCE_TYPES or _matches(url, BLOCK_URL_PATTERNS)
+
+    async def _on_paused(self, event, tab=None):
+        url = event.request.url
+        resource_type = event.resource_type.to_json()
+        cacheable = event.request.method == "GET" and resource_type in CACHE_RESOURCE_TYPES
+        try:
+            if event.response_status_code is not None:
+                # Response stage, only requested for cacheable types
+                if cacheable and event.response_status_code == 200:
+                    await self._store(event)
+                await self.page.send(cdp.fetch.continue_request(request_id=event.request_id))
+                return
+
+            if self.should_block(url, resource_type):
+                self.blocked += 1
+                self.bytes_blocked_estimate += int(1024 * BLOCKED_SIZE_ESTIMATES_KB.get(
+                    resource_type, BLOCKED_SIZE_ESTIMATES_KB.get("Other", 0)))
+                await self.page.send(cdp.fetch.fail_request(
+                    request_id=event.request_id,
+                    error_reason=cdp.network.ErrorReason.BLOCKED_BY_CLIENT
+                ))
+                return
+
+            cached = self.cache.get(url) if cacheable else None
+            if cached:
+                status, headers, body, size = cached
+                self.served_from_cache += 1
+                self.bytes_saved += size
+                await self.page.send(cdp.fetch.fulfill_request(
+                    request_id=event.request_id,
+                    response_code=status,
+                    response_headers=headers,
+                    body=body
+                ))
+                return
+
+            self.passed += 1
+            await self.page.send(cdp.fetch.continue_request(request_id=event.request_id))
+        except Exception as e:
+            # A paused request left alone would hang the page load
+            print(f"Interception of {url} failed: {e}", file=sys.stderr)
+            try:
+                await self.page.send(cdp.fetch.continue_request(request_id=event.request_id))
+            except Exception:
+                pass
+
+    async def _store(self, event):
+        body, is_base64 = await self.page.send(cdp.fetch.get_response_body(request_id=event.request_id))
+        if not is_base64:
+            body = base64.b64encode(body.encode("utf-8")).decode("ascii")
+        size = len(body) * 3 // 4
+        self.cache.put(event.request.url, event.response_status_code, event.response_headers or [], body, size)
+
+    def stats(self):
+        return {
+            "blocked": self.blocked,
+            "served_from_cache": self.served_from_cache,
+            "bytes_saved": self.bytes_saved,
+            "bytes_blocked_estimate": self.bytes_blocked_estimate,
+            "passed": self.passed,
+        }
+
+
+async def install_interception(page):
+    """Apply the blocking/caching policy to a tab once; no-op unless RESOURCE_BLOCKING is on"""
+    state = tab_state(page)
+    if not RESOURCE_BLOCKING or state.interception:
+        return
+    interception = PageInterception(page)
+    state.interception = interception
+    try:
+        await interception.enable()
+    except Exception as e:
+        print(f"Resource interception unavailable on this tab: {e}", file=sys.stderr)
+
+
+def interception_stats(page):
+    interception = tab_state(page).interception
+    return interception.stats() if interception else None
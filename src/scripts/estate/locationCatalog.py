@@ -0,0 +1,165 @@
+import asyncio
+import os
+import re
+import sys
+import time
+import unicodedata
+from formStore import db
+from readiness import get_readiness
+
+CATALOG_TTL = float(os.getenv("LOCATION_CATALOG_TTL_HOURS", "168")) * 3600
+
+# Walks every region of the form's dropdowns in page context and returns
+# [{code, name, cities: [{code, name}]}]; one evaluate instead of a wait per option
+_SCRAPE_JS = """
+(async () => {
+    const country = document.querySelector('#country_id');
+    const region = document.querySelector('#region');
+    const city = document.querySelector('#city');
+    if (!country || !region || !city) return null;
+
+    const setValue = (el, value) => {
+        if (window.$) {
+            window.$(el).val(value).trigger('change');
+        } else {
+            el.value = value;
+            el.dispatchEvent(new Event('change', { bubbles: true }));
+        }
+    };
+    const waitForOptions = (el, previous) => new Promise((resolve) => {
+        const done = () => { observer.disconnect(); clearTimeout(timer); resolve(); };
+        const observer = new MutationObserver(() => {
+            if (el.options.length > 1 && el.innerHTML !== previous) done();
+        });
+        const timer = setTimeout(done, 5000);
+        observer.observe(el, { childList: true, subtree: true });
+    });
+    const options = (el) => Array.from(el.options)
+        .filter((o) => o.value)
+        .map((o) => ({ code: o.value, name: o.text.trim() }));
+
+    if (region.options.length < 2) {
+        const loaded = waitForOptions(region, region.innerHTML);
+        setValue(country, '1');
+        await loaded;
+    }
+
+    const regions = [];
+    for (const r of options(region)) {
+        const loaded = waitForOptions(city, city.innerHTML);
+        setValue(region, r.code);
+        await loaded;
+        regions.push({ ...r, cities: options(city) });
+    }
+    return regions;
+})()
+"""
+
+
+def normalize_text(text: str) -> str:
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip()
+
+
+def _find(entries, name):
+    """Exact normalized-name match first, then the substring match set_location always used"""
+    wanted = normalize_text(name).lower()
+    if not wanted:
+        return None
+    for entry in entries:
+        if normalize_text(entry["name"]).lower() == wanted:
+            return entry
+    for entry in entries:
+        if wanted in normalize_text(entry["name"]).lower():
+            return entry
+    return None
+
+
+class LocationCatalog:
+    """Region -> city codes of the create-report form, persisted in Mongo and shared by every tab"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.regions = None
+        self.fetched_at = 0
+        self._lock = asyncio.Lock()
+        self._loaded = False  # Mongo was read once; after that only a scrape fills the catalog
+        self._refresh = None
+        self._scrape_failed_at = 0
+
+    @property
+    def stale(self):
+        return time.time() - self.fetched_at > CATALOG_TTL
+
+    async def _load(self):
+        doc = await self.collection.find_one({"_id": "catalog"})
+        if doc and doc.get("regions"):
+            self.regions = doc["regions"]
+            self.fetched_at = doc.get("fetched_at", 0)
+
+    async def _save(self, regions):
+        self.regions = regions
+        self.fetched_at = time.time()
+        await self.collection.replace_one(
+            {"_id": "catalog"},
+            {"_id": "catalog", "regions": regions, "fetched_at": self.fetched_at},
+            upsert=True
+        )
+        print(f"Location catalog saved: {len(regions)} regions", file=sys.stderr)
+
+    async def _scrape(self, page):
+        regions = await page.evaluate(_SCRAPE_JS, await_promise=True, return_by_value=True)
+        if isinstance(regions, list) and regions:
+            await self._save(regions)
+            return True
+        return False
+
+    async def _refresh_in_background(self, page):
+        """Scrape a second view of the same form page so the tab's own form is left alone"""
+        scratch = None
+        try:
+            scratch = await page.browser.get(await page.evaluate("window.location.href"), new_tab=True)
+            await (await get_readiness(scratch)).wait_for_network_idle()
+            if not await self._scrape(scratch):
+                self._scrape_failed_at = time.time()
+        except Exception as e:
+            self._scrape_failed_at = time.time()
+            print(f"Location catalog refresh failed: {e}", file=sys.stderr)
+        finally:
+            if scratch:
+                try:
+                    await scratch.close()
+                except Exception:
+                    pass
+
+    async def ensure(self, page):
+        """Whether the catalog is available; if nobody has scraped it yet, start that in a scratch tab.
+
+        Callers never wait for a scrape: until it lands they look codes up in their own dropdowns.
+        """
+        if self.regions is None and not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self._load()
+                    self._loaded = True
+        idle = self._refresh is None or self._refresh.done()
+        if self.regions is None:
+            if idle and time.time() - self._scrape_failed_at > 600:
+                self._refresh = asyncio.create_task(self._refresh_in_background(page))
+        elif self.stale and idle:
+            self._refresh = asyncio.create_task(self._refresh_in_background(page))
+        return self.regions is not None
+
+    def lookup(self, region_name, city_name):
+        """Return (region_code, city_code); None for anything not in the catalog"""
+        region = _find(self.regions or [], region_name)
+        if not region:
+            return None, None
+        city = _find(region["cities"], city_name)
+        return region["code"], city["code"] if city else None
+
+
+location_catalog = LocationCatalog(db.taqeemLocations)
@@ -75,18 +75,21 @@ async def submitOtp(page, otp, record_id=None):
         await otp_input.send_keys(otp)
         await asyncio.sleep(0.5)
 
-        verify_btn = None
-        for sel in [
+        verify_selectors = [
             "input[name='login'][type='submit']",
             "input[name='login']",
             "button[type='submit']",
             "button[name='login']",
             ".login-button",
             "input[type='submit']"
-        ]:
-            verify_btn = await wait_for_element(page, sel, timeout=3)
-            if verify_btn:
-                break
+        ]
+        verify_btn = None
+        # One wait for any candidate, then pick the most specific one that matched
+        if await wait_for_element(page, ", ".join(verify_selectors), timeout=3):
+            for sel in verify_selectors:
+                verify_btn = await page.query_selector(sel)
+                if verify_btn:
+                    break
 
         if not verify_btn:
             await closeBrowser()
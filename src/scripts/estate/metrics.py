@@ -0,0 +1,83 @@
+import math
+import time
+from collections import defaultdict, deque
+
+# Per-step samples kept per batch; enough for stable percentiles without growing with the batch
+SAMPLE_WINDOW = 500
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of numbers, None when empty"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class BatchMetrics:
+    """Step and record timings of one batch, shared by all of its tabs"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.step_durations = defaultdict(lambda: deque(maxlen=SAMPLE_WINDOW))
+        self.step_failures = defaultdict(int)
+        self.recent_steps = deque(maxlen=SAMPLE_WINDOW)  # (monotonic time, seconds, ok) of form steps
+        self.records_done = 0
+        self.records_failed = 0
+
+    def record_step(self, step, seconds, ok=True):
+        self.step_durations[step].append(seconds)
+        if not ok:
+            self.step_failures[step] += 1
+        if isinstance(step, int):
+            self.recent_steps.append((time.monotonic(), seconds, ok))
+
+    def record_finished(self, ok=True):
+        self.records_done += 1
+        if not ok:
+            self.records_failed += 1
+
+    def steps_since(self, since):
+        """Form-step samples recorded after a time.monotonic() instant"""
+        return [sample for sample in self.recent_steps if sample[0] > since]
+
+    def step_percentile(self, step, q):
+        return percentile(list(self.step_durations.get(step, ())), q)
+
+    def all_steps_percentile(self, q):
+        return percentile([s for samples in self.step_durations.values() for s in samples], q)
+
+    def records_per_minute(self):
+        elapsed = max(time.time() - self.started_at, 1e-6)
+        return self.records_done * 60 / elapsed
+
+    def summary(self):
+        return {
+            "records": self.records_done,
+            "failed": self.records_failed,
+            "records_per_min": round(self.records_per_minute(), 2),
+            "steps": {
+                str(step): {
+                    "count": len(samples),
+                    "p50": self.step_percentile(step, 50),
+                    "p95": self.step_percentile(step, 95),
+                    "failures": self.step_failures.get(step, 0)
+                }
+                for step, samples in sorted(self.step_durations.items(), key=lambda item: str(item[0]))
+            }
+        }
+
+
+_batches = {}
+
+
+def batch_metrics(batch_id):
+    """The metrics of a running batch, created on first use"""
+    if batch_id not in _batches:
+        _batches[batch_id] = BatchMetrics()
+    return _batches[batch_id]
+
+
+def pop_batch_metrics(batch_id):
+    return _batches.pop(batch_id, None)
@@ -1,8 +1,8 @@
-from browser import wait_for_element
+from browser import wait_for_element, PORTAL_BASE_URL
 
 async def post_login_navigation(page):
     try:
-        translate = await wait_for_element(page, "a[href='https://qima.taqeem.sa/setlocale/en']", timeout=10)
+        translate = await wait_for_element(page, f"a[href='{PORTAL_BASE_URL}/setlocale/en']", timeout=10)
         if not translate:
             return {"status": "FAILED", "error": "Translate link not found"}
 
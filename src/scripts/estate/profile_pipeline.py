@@ -0,0 +1,80 @@
+"""Profile the Python side of runFormFill on the in-memory fake browser.
+
+With BROWSER_BACKEND=fake every page call returns immediately, so what is
+left is fill_form, ProgressTracker, emit_progress, the queue and Mongo.
+
+    BENCH_MONGO_URI=mongodb://localhost:27017 python profile_pipeline.py --records 2000 --tabs 20
+
+Like benchmark.py it seeds and deletes its own batch, so never point
+BENCH_MONGO_URI at the production database.
+"""
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="cProfile runFormFill on the fake browser backend")
+    _parser.add_argument("--records", type=int, default=1000)
+    _parser.add_argument("--tabs", type=int, default=10)
+    _parser.add_argument("--sort", default="cumulative", help="pstats sort key")
+    _parser.add_argument("--limit", type=int, default=40, help="rows of the profile to print")
+    _parser.add_argument("--output", help="also dump the raw profile here (for snakeviz and friends)")
+    args = _parser.parse_args()
+
+    if not os.getenv("BENCH_MONGO_URI"):
+        sys.exit("Set BENCH_MONGO_URI to a scratch MongoDB; the profile run writes and deletes records there")
+    os.environ["MONGO_URI"] = os.environ["BENCH_MONGO_URI"]
+    os.environ["MONGO_DB"] = os.getenv("BENCH_MONGO_DB", "taqeemBenchmark")
+    os.environ["BROWSER_BACKEND"] = "fake"
+    # Settle times are real sleeps; without them the run measures Python, not timers
+    os.environ.setdefault("NETWORK_IDLE_TIME", "0")
+
+from browser import get_browser, closeBrowser
+from formStore import db, form_writer
+from formFiller import runFormFill
+from progress import progress_channel
+from benchmark import synthetic_record
+
+
+async def main(args):
+    batch_id = f"profile-{int(time.time() * 1000)}"
+    await db.taqeemForms.insert_many([synthetic_record(batch_id, i, "/dev/null") for i in range(args.records)])
+    browser = await get_browser()
+    progress_sink = open(os.devnull, "wb")
+    progress_channel.stream = progress_sink
+
+    profiler = cProfile.Profile()
+    started = time.monotonic()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            profiler.enable()
+            result = await runFormFill(browser, batch_id, num_tabs=args.tabs)
+            await form_writer.flush()
+            profiler.disable()
+    finally:
+        await db.taqeemForms.delete_many({"batch_id": batch_id})
+        await form_writer.close()
+        await closeBrowser()
+        progress_channel.close()
+        progress_sink.close()
+    elapsed = time.monotonic() - started
+
+    stats = pstats.Stats(profiler).strip_dirs().sort_stats(args.sort)
+    stats.print_stats(args.limit)
+    if args.output:
+        stats.dump_stats(args.output)
+
+    print(f"{result.get('successful_records', 0)}/{args.records} records in {elapsed:.2f}s "
+          f"({result.get('successful_records', 0) / max(elapsed, 1e-6):.0f} records/s) on {args.tabs} tabs, "
+          f"{browser.cdp_calls} fake CDP calls")
+    if result.get("status") != "SUCCESS":
+        print(f"runFormFill failed: {result.get('error')}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(args))
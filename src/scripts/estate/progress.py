@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+
+# Seconds between coalesced progress snapshots; 0 sends every event as it happens
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "0.5"))
+
+# Queued messages above which coalesced snapshots are held back until the reader catches up
+PROGRESS_HIGH_WATER = int(os.getenv("PROGRESS_HIGH_WATER", "1000"))
+
+# Sent at once, after whatever was pending for the batch, so the UI never misses an outcome
+IMMEDIATE_STATUSES = {
+    "COMPLETED", "FAILED", "STOPPED", "RECORD_SUCCESS", "RECORD_FAILED", "STEP_FAILED",
+    "BATCH_FAILED", "TAB_FAILED", "NO_RECORDS", "ERROR", "STARTED",
+    "RECORD_DEFERRED", "PORTAL_DEGRADED", "RETRYING", "SESSION_EXPIRED",
+}
+# Per-record chatter of one tab; only the latest of these per tab is worth sending
+PER_TAB_STATUSES = {
+    "RECORD_STARTED", "RECORD_RESUMED", "STEP_PROGRESS", "RECORD_COMPLETED", "PROCESSING", "TAB_PROGRESS",
+}
+
+
+def _json_line(msg):
+    return (json.dumps(msg, default=str) + "\n").encode("utf-8")
+
+
+class ProgressChannel:
+    """Coalesces progress events into periodic snapshots and writes stdout from a thread of its own,
+    so a slow reader on the other end of the pipe never stalls the event loop.
+
+    Messages are encoded on the writer thread, so they must not be changed once sent."""
+
+    def __init__(self, interval=PROGRESS_INTERVAL, stream=None, encode=_json_line):
+        self.interval = interval
+        self.stream = stream  # binary; defaults to whatever sys.stdout is at write time
+        self.encode = encode  # message -> bytes, replaced by transport.open_transport
+        self.sent = 0
+        self.coalesced = 0
+        self._pending = {}  # coalescing key -> latest event, in first-seen order
+        self._timer = None
+        self._messages = queue.SimpleQueue()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def _write_loop(self):
+        while True:
+            msg = self._messages.get()
+            if msg is None:
+                return
+            stream = self.stream or sys.stdout.buffer
+            try:
+                stream.write(self.encode(msg))
+                # Drain whatever queued up meanwhile before paying for the flush
+                while True:
+                    try:
+                        msg = self._messages.get_nowait()
+                    except queue.Empty:
+                        break
+                    if msg is None:
+                        stream.flush()
+                        return
+                    stream.write(self.encode(msg))
+                stream.flush()
+            except Exception as e:
+                print(f"Progress write failed: {e}", file=sys.stderr)
+
+    def _enqueue(self, data):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="progress-writer", daemon=True)
+                self._writer.start()
+        self._messages.put(data)
+        self.sent += 1
+
+    def send(self, data):
+        """Queue a message for stdout as-is, after the pending progress of its batch; returns immediately"""
+        if data.get("batchId") is not None:
+            self.flush(data["batchId"])
+        self._enqueue(data)
+
+    def emit(self, data):
+        """Send a PROGRESS event, merging it with later ones of the same tab unless it is terminal"""
+        status = data.get("status")
+        batch_id = data.get("batchId")
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if self.interval <= 0 or loop is None or status in IMMEDIATE_STATUSES:
+            self.flush(batch_id)
+            self._enqueue(data)
+            return
+
+        if status in PER_TAB_STATUSES:
+            key = (batch_id, "tab", data.get("tab_id"))
+        else:
+            key = (batch_id, status, data.get("tab_id"))
+        if key in self._pending:
+            self.coalesced += 1
+            data = {**data, "coalesced": self._pending[key].get("coalesced", 0) + 1}
+        self._pending[key] = data
+
+        if self._timer is None:
+            self._timer = loop.call_later(self.interval, self._on_timer)
+
+    @property
+    def backlog(self):
+        """Messages queued but not yet written"""
+        return self._messages.qsize()
+
+    def _on_timer(self):
+        self._timer = None
+        if self.backlog > PROGRESS_HIGH_WATER:
+            # The reader is behind: keep merging instead of piling more snapshots onto the pipe
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._on_timer)
+            return
+        self.flush()
+
+    def flush(self, batch_id=None):
+        """Send pending snapshots now, all of them or only those of one batch"""
+        if batch_id is None:
+            pending, self._pending = self._pending, {}
+        else:
+            pending = {key: event for key, event in self._pending.items() if key[0] == batch_id}
+            for key in pending:
+                del self._pending[key]
+        for event in pending.values():
+            self._enqueue(event)
+
+    def close(self, timeout=5):
+        """Send what is pending and wait for the writer to drain"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self.flush()
+        if self._writer and self._writer.is_alive():
+            self._messages.put(None)
+            self._writer.join(timeout)
+        self._writer = None
+
+
+progress_channel = ProgressChannel()
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+from nodriver import cdp
+from interception import install_interception
+from tabState import tab_state
+
+# Minimum time every readiness wait takes, for when the portal is flaky and
+# reports idle before its scripts have finished wiring up the form
+READINESS_FLOOR = float(os.getenv("READINESS_FLOOR", "0"))
+NETWORK_IDLE_TIME = float(os.getenv("NETWORK_IDLE_TIME", "0.5"))
+
+_XHR_TYPES = {cdp.network.ResourceType.XHR, cdp.network.ResourceType.FETCH}
+
+
+class PageReadiness:
+    """Tracks navigation and in-flight requests of one tab from CDP events"""
+
+    def __init__(self, page):
+        self.page = page
+        self.pending = {}  # request_id -> is_xhr
+        self.last_activity = time.monotonic()
+        self.document_status = None  # HTTP status of the last document response, for spotting portal 5xx pages
+        self.committed = asyncio.Event()
+        self.loaded = asyncio.Event()
+        self._changed = asyncio.Event()
+        # The document present when tracking starts counts as loaded
+        self.committed.set()
+        self.loaded.set()
+
+    async def enable(self):
+        self.page.add_handler(cdp.network.RequestWillBeSent, self._on_request)
+        self.page.add_handler(cdp.network.ResponseReceived, self._on_response)
+        self.page.add_handler(cdp.network.LoadingFinished, self._on_request_done)
+        self.page.add_handler(cdp.network.LoadingFailed, self._on_request_done)
+        self.page.add_handler(cdp.page.FrameNavigated, self._on_frame_navigated)
+        self.page.add_handler(cdp.page.LoadEventFired, self._on_load)
+        await self.page.send(cdp.network.enable())
+        await self.page.send(cdp.page.enable())
+
+    def _touch(self):
+        self.last_activity = time.monotonic()
+        self._changed.set()
+
+    def _on_request(self, event, tab=None):
+        self.pending[event.request_id] = event.type_ in _XHR_TYPES
+        self._touch()
+
+    def _on_response(self, event, tab=None):
+        if event.type_ == cdp.network.ResourceType.DOCUMENT:
+            self.document_status = event.response.status
+
+    def _on_request_done(self, event, tab=None):
+        self.pending.pop(event.request_id, None)
+        self._touch()
+
+    def _on_frame_navigated(self, event, tab=None):
+        if event.frame.parent_id is None:
+            # A new document drops every request the old one had in flight
+            self.pending.clear()
+            self.loaded.clear()
+            self.committed.set()
+            self._touch()
+
+    def _on_load(self, event, tab=None):
+        self.loaded.set()
+        self._touch()
+
+    @property
+    def pending_xhr(self):
+        return sum(1 for is_xhr in self.pending.values() if is_xhr)
+
+    def expect_navigation(self):
+        """Call right before an action that navigates, so waits ignore the previous document"""
+        self.committed.clear()
+        self.loaded.clear()
+
+    async def _wait_until(self, predicate, timeout, settle=0.0):
+        """Wait until predicate() has held for `settle` seconds, waking only on CDP events"""
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            quiet_for = now - self.last_activity
+            if predicate() and quiet_for >= settle:
+                return True
+            remaining = deadline - now
+            if remaining <= 0:
+                return False
+            wake_in = remaining
+            if predicate():
+                wake_in = min(remaining, settle - quiet_for)
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), wake_in)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _apply_floor(self, started):
+        elapsed = time.monotonic() - started
+        if elapsed < READINESS_FLOOR:
+            await asyncio.sleep(READINESS_FLOOR - elapsed)
+
+    async def wait_for_navigation(self, timeout=15):
+        """Wait for the main frame to commit a new document and fire its load event"""
+        started = time.monotonic()
+        ok = await self._wait_until(lambda: self.committed.is_set() and self.loaded.is_set(), timeout)
+        await self._apply_floor(started)
+        return ok
+
+    async def wait_for_network_idle(self, timeout=15, idle_time=NETWORK_IDLE_TIME):
+        """Wait until no request has been in flight for idle_time seconds"""
+        started = time.monotonic()
+        ok = await self._wait_until(lambda: not self.pending, timeout, settle=idle_time)
+        await self._apply_floor(started)
+        return ok
+
+    async def wait_for_xhr_idle(self, timeout=10):
+        """Wait until the page has no XHR/fetch requests in flight"""
+        started = time.monotonic()
+        ok = await self._wait_until(lambda: self.pending_xhr == 0, timeout, settle=0.05)
+        await self._apply_floor(started)
+        return ok
+
+    async def wait_until_ready(self, timeout=20):
+        """Navigation committed, document loaded and network quiet"""
+        started = time.monotonic()
+        ok = await self._wait_until(lambda: self.committed.is_set() and self.loaded.is_set(), timeout)
+        remaining = max(0.0, timeout - (time.monotonic() - started))
+        ok = await self._wait_until(lambda: not self.pending, remaining, settle=NETWORK_IDLE_TIME) and ok
+        await self._apply_floor(started)
+        return ok
+
+
+async def get_readiness(page):
+    """Return the tab's readiness tracker, enabling the CDP domains on first use"""
+    state = tab_state(page)
+    if state.readiness is None:
+        readiness = PageReadiness(page)
+        await readiness.enable()
+        state.readiness = readiness
+    return state.readiness
+
+
+async def navigate(page, url, timeout=20):
+    """Navigate a tab and wait until the new document is ready"""
+    await install_interception(page)
+    readiness = await get_readiness(page)
+    readiness.expect_navigation()
+    await page.get(url)
+    return await readiness.wait_until_ready(timeout)
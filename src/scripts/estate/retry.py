@@ -0,0 +1,204 @@
+"""Failure classification, backoff and the portal circuit breaker.
+
+Every failed step or record is put into one failure class, and the class
+decides how often it is retried and how long to wait between attempts.
+Validation errors are retried in place, on the same step, re-filling only
+the fields the portal flagged. Records that fail for any other reason are
+queued and retried after the rest of the batch (see runFormFill).
+
+Backoff per class is "attempts,base seconds,max seconds" and can be
+overridden with RETRY_<CLASS>, e.g. RETRY_PORTAL_5XX=5,10,120.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+from urllib.parse import urlparse
+from nodriver.core.connection import ProtocolException
+from websockets.exceptions import ConnectionClosed
+from browser import PORTAL_BASE_URL, LOGIN_URL
+from readiness import get_readiness
+
+VALIDATION = "validation"
+TIMEOUT = "timeout"
+NAVIGATION = "navigation"
+SESSION_EXPIRED = "session_expired"
+PORTAL_ERROR = "portal_5xx"
+UNKNOWN = "unknown"
+
+# Failures that say the portal itself is struggling; these are what trip the breaker
+PORTAL_FAILURES = {TIMEOUT, NAVIGATION, PORTAL_ERROR}
+
+# CDP "server error" and "session not found": the document or target went away under the command
+CDP_NAVIGATION_CODES = {-32000, -32001}
+
+# Portal-side failures within BREAKER_WINDOW seconds that open the breaker for BREAKER_COOLDOWN seconds
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "60"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+
+class RetryPolicy:
+    """How many attempts a failure class gets and the exponential backoff between them"""
+
+    def __init__(self, attempts, base_delay, max_delay):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number `attempt` (1-based): half fixed, half random jitter"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def allows(self, attempt):
+        """Whether retry number `attempt` may still be made"""
+        return attempt <= self.attempts
+
+
+def _policy(failure_class, attempts, base_delay, max_delay):
+    override = os.getenv(f"RETRY_{failure_class.upper()}")
+    if override:
+        try:
+            attempts, base_delay, max_delay = override.split(",")
+            return RetryPolicy(int(attempts), float(base_delay), float(max_delay))
+        except ValueError:
+            print(f"Ignoring malformed RETRY_{failure_class.upper()}={override!r}", file=sys.stderr)
+    return RetryPolicy(attempts, base_delay, max_delay)
+
+
+RETRY_POLICIES = {
+    VALIDATION: _policy(VALIDATION, 2, 0.5, 4),
+    TIMEOUT: _policy(TIMEOUT, 2, 2, 30),
+    NAVIGATION: _policy(NAVIGATION, 2, 1, 15),
+    SESSION_EXPIRED: _policy(SESSION_EXPIRED, 1, 5, 5),
+    PORTAL_ERROR: _policy(PORTAL_ERROR, 3, 5, 60),
+    UNKNOWN: _policy(UNKNOWN, 1, 1, 5),
+}
+
+
+def policy_for(failure_class):
+    return RETRY_POLICIES.get(failure_class, RETRY_POLICIES[UNKNOWN])
+
+
+class PortalFailure(Exception):
+    """A failure whose class is already known, e.g. a 5xx page or a bounce to the login page"""
+
+    def __init__(self, failure_class, message):
+        super().__init__(message)
+        self.failure_class = failure_class
+
+
+def classify(error):
+    """Failure class of an exception, from its type or CDP error code; messages are never parsed.
+
+    Validation errors, missing buttons and 5xx or login pages are detected where they happen
+    and carry their class already (a PortalFailure or a step result's "failure").
+    """
+    if getattr(error, "failure_class", None):
+        return error.failure_class
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return TIMEOUT
+    if isinstance(error, ProtocolException):
+        # Anything else (a script error, bad params) says nothing about the page or the portal
+        return NAVIGATION if error.code in CDP_NAVIGATION_CODES else UNKNOWN
+    if isinstance(error, (ConnectionClosed, ConnectionError)):
+        # Chrome's DevTools socket dropped
+        return NAVIGATION
+    return UNKNOWN
+
+
+def url_failure(url):
+    """SESSION_EXPIRED if a portal request ended up on the login page or another host, else None"""
+    parsed = urlparse(url or "")
+    if parsed.scheme in ("http", "https"):
+        if url.startswith(LOGIN_URL.split("?")[0]) or parsed.netloc != urlparse(PORTAL_BASE_URL).netloc \
+                or "/login" in parsed.path:
+            return SESSION_EXPIRED
+    return None
+
+
+async def inspect_page(page):
+    """Failure class the tab's current document shows by itself, or None if it looks like a normal portal page"""
+    try:
+        url = await page.evaluate("window.location.href") or ""
+    except Exception:
+        return NAVIGATION
+    if url_failure(url):
+        return SESSION_EXPIRED
+    status = (await get_readiness(page)).document_status
+    if status and status >= 500:
+        return PORTAL_ERROR
+    return None
+
+
+class CircuitBreaker:
+    """Holds every tab back from the portal for a while once portal-side failures pile up.
+
+    After the cooldown one tab is let through as a probe; the others wait
+    until the probe succeeds (breaker closes) or fails (breaker reopens).
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, window=BREAKER_WINDOW, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.state = "closed"  # closed, open or half_open
+        self.opened_at = 0.0
+        self.trips = 0
+        self._failures = deque()
+        self._settled = asyncio.Event()
+
+    def _open(self, now):
+        self.state = "open"
+        self.opened_at = now
+        self.trips += 1
+        self._failures.clear()
+        self._settled.set()
+        print(f"Portal looks degraded, pausing tabs for {self.cooldown:.0f}s", file=sys.stderr)
+
+    def record(self, failure_class=None):
+        """Count an outcome (None for success); returns True if this one opened the breaker"""
+        now = time.monotonic()
+        if failure_class not in PORTAL_FAILURES:
+            # The portal answered, so it is serving again
+            if self.state == "half_open":
+                self.state = "closed"
+                self._settled.set()
+            self._failures.clear()
+            return False
+        if self.state == "half_open":
+            self._open(now)
+            return True
+        self._failures.append(now)
+        while self._failures and now - self._failures[0] > self.window:
+            self._failures.popleft()
+        if self.state == "closed" and len(self._failures) >= self.threshold:
+            self._open(now)
+            return True
+        return False
+
+    async def wait(self):
+        """Return once the portal may be used; returns the seconds spent waiting"""
+        started = time.monotonic()
+        while self.state != "closed":
+            if self.state == "open":
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                    continue
+                # This caller is the probe
+                self.state = "half_open"
+                self._settled.clear()
+                break
+            try:
+                await asyncio.wait_for(self._settled.wait(), self.cooldown)
+            except asyncio.TimeoutError:
+                # The probe never reported back; stop holding everyone for it
+                self.state = "closed"
+        return time.monotonic() - started
+
+
+portal_breaker = CircuitBreaker()
@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import os
+from formFiller import emit_progress
+
+
+class TabSlot:
+    """A batch's share of the global tab budget"""
+
+    def __init__(self, batch_id, requested, priority=0):
+        self.batch_id = batch_id
+        self.requested = max(1, requested)
+        self.priority = max(0, priority)
+        self.tabs = 0
+        self.on_change = None  # called with the new tab count whenever the scheduler rebalances
+
+    @property
+    def weight(self):
+        return 1 + self.priority
+
+    def _assign(self, tabs):
+        if tabs != self.tabs:
+            self.tabs = tabs
+            if self.on_change:
+                self.on_change(tabs)
+
+
+class TabScheduler:
+    """Owns the worker's tab budget and shares it between running batches by priority weight"""
+
+    def __init__(self, budget):
+        self.budget = max(1, budget)
+        self.active = {}  # batch_id -> TabSlot
+        self.waiting = []  # (priority, seq, slot, future), admitted highest priority first, then FIFO
+        self._seq = itertools.count()
+
+    async def admit(self, batch_id, requested, priority=0):
+        """Return the batch's slot once it can get at least one tab; queued batches get their position reported"""
+        slot = TabSlot(batch_id, requested, priority)
+        if len(self.active) < self.budget and not self.waiting:
+            self.active[batch_id] = slot
+            self._rebalance()
+            return slot
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append((-slot.priority, next(self._seq), slot, future))
+        self.waiting.sort(key=lambda entry: entry[:2])
+        self._report_queue()
+        await future
+        return slot
+
+    def withdraw(self, batch_id, exc):
+        """Drop a queued batch, failing its admit() with exc; returns False if it was not queued"""
+        for entry in self.waiting:
+            if entry[2].batch_id == batch_id:
+                self.waiting.remove(entry)
+                entry[3].set_exception(exc)
+                self._report_queue()
+                return True
+        return False
+
+    def release(self, batch_id):
+        """Give a finished batch's tabs back, admitting queued batches and rebalancing the rest"""
+        if self.active.pop(batch_id, None) is None:
+            return
+        while self.waiting and len(self.active) < self.budget:
+            _, _, slot, future = self.waiting.pop(0)
+            self.active[slot.batch_id] = slot
+            future.set_result(slot)
+        self._rebalance()
+        self._report_queue()
+
+    def free_tabs(self):
+        """Tabs of the budget no running batch is allotted; standby and prefetched tabs must fit in these"""
+        return self.budget - sum(slot.tabs for slot in self.active.values())
+
+    def _rebalance(self):
+        """Weighted max-min fair share: every batch gets one tab, spare tabs go to the least served by weight"""
+        allocation = {batch_id: 1 for batch_id in self.active}
+        spare = self.budget - len(allocation)
+        while spare > 0:
+            hungry = [slot for slot in self.active.values() if allocation[slot.batch_id] < slot.requested]
+            if not hungry:
+                break
+            slot = min(hungry, key=lambda s: (allocation[s.batch_id] / s.weight, -s.weight))
+            allocation[slot.batch_id] += 1
+            spare -= 1
+        for batch_id, tabs in allocation.items():
+            self.active[batch_id]._assign(tabs)
+
+    def _report_queue(self):
+        for position, (_, _, slot, _) in enumerate(self.waiting, 1):
+            emit_progress("QUEUED", f"Waiting for a free tab, position {position} in queue", slot.batch_id,
+                         queue_position=position, queue_length=len(self.waiting),
+                         active_batches=len(self.active))
+
+
+scheduler = TabScheduler(int(os.getenv("MAX_TOTAL_TABS", "10")))
@@ -0,0 +1,139 @@
+"""Authenticated portal session: captured after OTP, replayed into new browsers, contexts and shards.
+
+The session (cookies plus the portal's localStorage) is kept in memory.
+With SESSION_FILE and SESSION_KEY set it is also written there, encrypted,
+so a restarted worker starts logged in; this needs the optional
+`cryptography` package, and without it the session stays in memory only.
+"""
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+from dotenv import load_dotenv
+from nodriver import cdp
+from tabState import tab_state
+
+load_dotenv()
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+SESSION_FILE = os.getenv("SESSION_FILE")
+SESSION_KEY = os.getenv("SESSION_KEY")
+# Portal sessions expire server-side; older captures are not worth replaying
+SESSION_MAX_AGE = float(os.getenv("SESSION_MAX_AGE_HOURS", "8")) * 3600
+# "context" gives every extra tab its own browser context, seeded with the session
+TAB_ISOLATION = os.getenv("TAB_ISOLATION", "shared").lower()
+
+_session = None
+
+
+def _fernet():
+    if not (SESSION_FILE and SESSION_KEY):
+        return None
+    if Fernet is None:
+        print("SESSION_FILE is set but the cryptography package is missing; keeping the session in memory only",
+              file=sys.stderr)
+        return None
+    # Any passphrase works as SESSION_KEY; Fernet wants 32 url-safe base64 bytes
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(SESSION_KEY.encode("utf-8")).digest()))
+
+
+def _fresh(session):
+    return bool(session) and time.time() - session.get("captured_at", 0) < SESSION_MAX_AGE
+
+
+def get_session():
+    """The current session: in memory, else from the encrypted file; None if there is none or it expired"""
+    global _session
+    if _session is None:
+        fernet = _fernet()
+        if fernet and os.path.exists(SESSION_FILE):
+            try:
+                with open(SESSION_FILE, "rb") as f:
+                    _session = json.loads(fernet.decrypt(f.read()))
+            except (InvalidToken, ValueError, OSError) as e:
+                print(f"Could not read saved session: {e}", file=sys.stderr)
+    return _session if _fresh(_session) else None
+
+
+def set_session(session):
+    """Keep a session (captured here or received from another worker) and persist it if configured"""
+    global _session
+    _session = session
+    fernet = _fernet()
+    if fernet:
+        tmp = f"{SESSION_FILE}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(fernet.encrypt(json.dumps(session).encode("utf-8")))
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, SESSION_FILE)
+
+
+async def capture_session(page):
+    """Record the tab's cookies and its origin's localStorage, right after a successful login"""
+    cookies = await page.send(cdp.storage.get_cookies())
+    origin = await page.evaluate("window.location.origin")
+    local_storage = await page.evaluate("JSON.stringify(Object.assign({}, window.localStorage))")
+    user_agent = await page.evaluate("navigator.userAgent")
+    session = {
+        "cookies": [cookie.to_json() for cookie in cookies],
+        "local_storage": {origin: json.loads(local_storage or "{}")} if origin and origin != "null" else {},
+        # Direct HTTP submission (httpSubmit.py) presents itself as the same browser
+        "user_agent": user_agent,
+        "captured_at": time.time(),
+    }
+    set_session(session)
+    print(f"Captured session: {len(session['cookies'])} cookies", file=sys.stderr)
+    return session
+
+
+def _cookie_param(cookie):
+    expires = cookie.get("expires")
+    return cdp.network.CookieParam(
+        name=cookie["name"],
+        value=cookie["value"],
+        domain=cookie.get("domain"),
+        path=cookie.get("path"),
+        secure=cookie.get("secure"),
+        http_only=cookie.get("httpOnly"),
+        same_site=cdp.network.CookieSameSite.from_json(cookie["sameSite"]) if cookie.get("sameSite") else None,
+        expires=cdp.network.TimeSinceEpoch(expires) if not cookie.get("session") and expires and expires > 0 else None,
+    )
+
+
+async def restore_session(page, session=None):
+    """Seed the tab's browser context with the session; returns False when there is none to restore"""
+    session = session or get_session()
+    if not session:
+        return False
+    await page.send(cdp.network.set_cookies(cookies=[_cookie_param(c) for c in session["cookies"]]))
+    if session.get("local_storage"):
+        await page.send(cdp.dom_storage.enable())
+        for origin, items in session["local_storage"].items():
+            storage_id = cdp.dom_storage.StorageId(is_local_storage=True, security_origin=origin)
+            for key, value in items.items():
+                await page.send(cdp.dom_storage.set_dom_storage_item(storage_id=storage_id, key=key, value=value))
+    return True
+
+
+async def open_session_tab(browser):
+    """A blank tab for a worker tab: in the shared cookie jar, or in its own logged-in context"""
+    if TAB_ISOLATION != "context":
+        return await browser.get("about:blank", new_tab=True)
+    page = await browser.create_context("about:blank")
+    if not await restore_session(page):
+        print("Opened an isolated tab without a captured session; it will not be logged in", file=sys.stderr)
+    tab_state(page).own_context = True
+    return page
+
+
+async def close_session_tab(page):
+    context_id = page.target.browser_context_id if tab_state(page).own_context else None
+    await page.close()
+    if context_id:
+        await page.browser.connection.send(cdp.target.dispose_browser_context(browser_context_id=context_id))
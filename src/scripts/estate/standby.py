@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from browser import FORM_URL, needs_recycle
+from readiness import navigate
+from session import open_session_tab, close_session_tab
+from tabState import tab_state
+
+# Tabs kept open on a blank create-report form, ready for the next batch or record; 0 disables the pool
+STANDBY_TABS = int(os.getenv("STANDBY_TABS", "0"))
+# A form left open longer than this may carry an expired token, so it is reloaded before use
+STANDBY_MAX_AGE = float(os.getenv("STANDBY_MAX_AGE", "600"))
+# Start Chrome (and fill the pool, if a session exists) when the worker starts instead of on first login
+PREWARM_BROWSER = os.getenv("PREWARM_BROWSER", "false").lower() in ("true", "1", "yes")
+
+
+def consume_blank_form(page):
+    """True once if the tab is sitting on a freshly loaded blank form, so the next record can skip navigating"""
+    state = tab_state(page)
+    loaded_at, state.blank_form_at = state.blank_form_at, None
+    return loaded_at is not None and time.monotonic() - loaded_at < STANDBY_MAX_AGE
+
+
+class StandbyPool:
+    """Tabs pre-navigated to the create-report form, shared by every batch of the worker"""
+
+    def __init__(self, size=STANDBY_TABS):
+        self.size = size
+        self.browser = None
+        self._ready = deque()
+        self._warming = set()
+        self._prefetching = set()
+        self.free_tabs = None  # callable: tabs the worker's tab budget has left over, see TabScheduler.free_tabs
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def _budget_left(self):
+        """How many more tabs the pool may open before it exceeds what the batches left of the budget"""
+        if self.free_tabs is None:
+            return self.size
+        return self.free_tabs() - len(self._ready) - len(self._warming) - len(self._prefetching)
+
+    async def _load(self, page=None, browser=None):
+        """Open (or reuse) a tab and load the blank form in it; None if that failed"""
+        try:
+            if page is None:
+                page = await open_session_tab(browser or self.browser)
+            loaded = await navigate(page, FORM_URL)
+            if not loaded or "/report/create" not in await page.evaluate("window.location.href"):
+                # Most likely bounced to the login page: the session is gone
+                raise RuntimeError("blank form did not load")
+            tab_state(page).blank_form_at = time.monotonic()
+            return page
+        except asyncio.CancelledError:
+            await self._close(page)
+            raise
+        except Exception as e:
+            print(f"Standby tab could not be prepared: {e}", file=sys.stderr)
+            await self._close(page)
+            return None
+
+    async def _warm(self, page=None):
+        page = await self._load(page)
+        if page is not None:
+            self._ready.append(page)
+
+    def _start_warming(self, page=None):
+        task = asyncio.create_task(self._warm(page))
+        self._warming.add(task)
+        task.add_done_callback(self._warming.discard)
+
+    async def _close(self, page):
+        if page is None or page is page.browser.main_tab:
+            return
+        try:
+            await close_session_tab(page)
+        except Exception:
+            pass
+
+    def fill(self, browser):
+        """Top the pool up to its size in the background"""
+        if not self.enabled:
+            return
+        if browser is not self.browser:
+            self.reset()
+            self.browser = browser
+        while len(self._ready) + len(self._warming) < self.size and self._budget_left() > 0:
+            self._start_warming()
+
+    def reset(self):
+        """Forget every standby tab, e.g. because their browser is being replaced"""
+        for task in self._warming:
+            task.cancel()
+        self._warming.clear()
+        self._ready.clear()
+        self.browser = None
+
+    def take(self, browser):
+        """A ready tab on the blank form, or None if the pool has none right now"""
+        if not self.enabled or browser is not self.browser:
+            return None
+        while self._ready:
+            page = self._ready.popleft()
+            if (tab_state(page).blank_form_at or 0) + STANDBY_MAX_AGE > time.monotonic():
+                self.fill(browser)
+                return page
+            self._start_warming(page)
+        self.fill(browser)
+        return None
+
+    def prefetch(self, browser):
+        """Task resolving to a tab with the next blank form loaded, taken from the pool or loaded now;
+        None when a new tab would not fit in the tab budget"""
+        page = self.take(browser)
+        if page is not None:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(page)
+            return future
+        if self._budget_left() <= 0:
+            return None
+        task = asyncio.create_task(self._load(browser=browser))
+        self._prefetching.add(task)
+        task.add_done_callback(self._prefetching.discard)
+        return task
+
+    def release(self, page):
+        """Hand a tab back: reloaded into the pool if there is room, closed otherwise"""
+        tab_state(page).blank_form_at = None
+        if page is page.browser.main_tab:
+            # The main tab belongs to login; it is never pooled or closed
+            return
+        if needs_recycle(page):
+            # Worn out (too many records or too much memory): not worth keeping
+            asyncio.create_task(self._close(page))
+        elif self.enabled and page.browser is self.browser and len(self._ready) + len(self._warming) < self.size \
+                and self._budget_left() > 0:
+            self._start_warming(page)
+        else:
+            asyncio.create_task(self._close(page))
+
+    def release_prefetched(self, prefetched):
+        """Give back a prefetched tab that ended up unused, once its load finishes"""
+        def done(task):
+            if not task.cancelled() and task.exception() is None and task.result() is not None:
+                self.release(task.result())
+        prefetched.add_done_callback(done)
+
+
+standby_pool = StandbyPool()
@@ -0,0 +1,260 @@
+"""Local stand-in for the qima portal, for benchmarking the worker without touching production.
+
+Serves the SSO login and OTP pages and the three create-report steps with
+the selectors login.py, navigation.py and formSteps.py expect, including the
+AJAX-populated dropdowns. Latency, jitter and the validation error rate are
+configurable.
+
+    python standinPortal.py --port 8765 --latency 0.05 --error-rate 0.02
+
+Point the worker at it with PORTAL_BASE_URL=http://127.0.0.1:8765 and
+LOGIN_URL=http://127.0.0.1:8765/login.
+"""
+import argparse
+import html
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from formSteps import form_steps
+
+REGIONS = {
+    "1": ("Riyadh", {"101": "Riyadh", "102": "Diriyah", "103": "Al Kharj"}),
+    "2": ("Makkah", {"201": "Jeddah", "202": "Makkah", "203": "Taif"}),
+    "3": ("Eastern Province", {"301": "Dammam", "302": "Khobar", "303": "Al Ahsa"}),
+}
+ASSET_TYPES = {"1": "Land", "2": "Villa", "3": "Apartment"}
+ASSET_USAGES = {
+    "1": {"11": "Residential", "12": "Commercial"},
+    "2": {"21": "Residential"},
+    "3": {"31": "Residential", "32": "Mixed use"},
+}
+RADIO_LABELS = ["Detailed report", "Summary report", "Yes", "No"]
+
+_SELECTOR = re.compile(r"\[(name|id)='(.+)'\]")
+
+_DROPDOWN_JS = """
+<script>
+async function load(select, url) {
+    const res = await fetch(url);
+    const items = await res.json();
+    select.innerHTML = '<option value="">--</option>' +
+        items.map(i => `<option value="${i.code}">${i.name}</option>`).join('');
+}
+const on = (sel, fn) => { const el = document.querySelector(sel); if (el) el.addEventListener('change', fn); };
+on('#country_id', e => load(document.querySelector('#region'), '/api/regions?country=' + e.target.value));
+on('#region', e => load(document.querySelector('#city'), '/api/cities?region=' + e.target.value));
+on("[name='asset_type_id']", e => load(document.querySelector("[name='asset_usage_id']"), '/api/asset-usages?asset_type=' + e.target.value));
+</script>
+"""
+
+
+def _attrs(selector):
+    kind, value = _SELECTOR.match(selector).groups()
+    value = html.escape(value, quote=True)
+    return f'{kind}="{value}"' if kind == "id" else f'name="{value}" id="f-{value}"'
+
+
+def _options(items):
+    return '<option value="">--</option>' + "".join(
+        f'<option value="{code}">{html.escape(name)}</option>' for code, name in items.items()
+    )
+
+
+def _render_field(key, selector, field_type):
+    attrs = _attrs(selector)
+    if key == "country":
+        return '<select id="country_id" name="country_id"><option value="">--</option><option value="1">Saudi Arabia</option></select>'
+    if key in ("region", "city"):
+        return f'<select id="{key}" name="{key}_id"><option value="">--</option></select>'
+    if key == "asset_type":
+        return f"<select {attrs}>{_options(ASSET_TYPES)}</select>"
+    if key == "asset_usage_sector":
+        return f'<select {attrs}><option value="">--</option></select>'
+    if field_type == "select":
+        return f"<select {attrs}>{_options({str(i): f'Option {i}' for i in range(1, 4)})}</select>"
+    if field_type == "checkbox":
+        return f'<input type="checkbox" {attrs} value="1">'
+    if field_type == "file":
+        return f'<input type="file" {attrs}>'
+    if field_type == "radio":
+        # The form addresses radio groups through their wrapper; the runtime picks options by label
+        return f"<div {attrs}>" + "".join(
+            f'<input type="radio" id="{key}-{i}" name="{key}" value="{i}">'
+            f'<label class="form-check-label" for="{key}-{i}">{label}</label>'
+            for i, label in enumerate(RADIO_LABELS)
+        ) + "</div>"
+    return f'<input type="text" {attrs}>'
+
+
+def _page(title, body):
+    return f"<!doctype html><html><head><title>{title}</title></head><body>{body}</body></html>"
+
+
+def render_step(step_num, action, error=False):
+    step = form_steps[step_num - 1]
+    # A rejected submit flags the first field, the way the portal marks the ones it wants corrected
+    feedback = '<div class="invalid-feedback">This field is required</div>'
+    fields = "".join(
+        f"<div>{_render_field(key, selector, step['field_types'].get(key, 'text'))}"
+        f"{feedback if error and index == 0 else ''}</div>"
+        for index, (key, selector) in enumerate(step["field_map"].items())
+    )
+    button = (
+        '<input type="submit" name="save" value="Save">' if step_num == len(form_steps)
+        else '<input type="submit" name="continue" value="Continue">'
+    )
+    alert = '<div class="alert alert-danger">Please correct the highlighted fields</div>' if error else ""
+    return _page(
+        f"Step {step_num}",
+        f'{alert}<form method="post" action="{action}" enctype="multipart/form-data">{fields}{button}</form>{_DROPDOWN_JS}'
+    )
+
+
+class StandinPortal:
+    """Shared state and knobs of one stand-in server"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drafts = {}  # draft id -> last completed step
+        self.saved = 0
+        self.requests = 0
+        self._ids = itertools.count(1000)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            self.requests += 1
+        pause = self.latency + random.uniform(0, self.jitter)
+        if pause > 0:
+            time.sleep(pause)
+
+    def new_draft(self):
+        with self._lock:
+            draft_id = next(self._ids)
+            self.drafts[draft_id] = 1
+            return draft_id
+
+
+def make_handler(portal, base_url):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body="", content_type="text/html; charset=utf-8", location=None):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            if location:
+                self.send_header("Location", location)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _json(self, items):
+            self._send(200, json.dumps([{"code": c, "name": n} for c, n in items.items()]), "application/json")
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def do_GET(self):
+            portal.delay()
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            path = url.path.rstrip("/")
+
+            if path == "/login":
+                return self._send(200, _page("Login", (
+                    '<form method="post" action="/login"><input id="username" name="username">'
+                    '<input type="password" name="password"><button id="kc-login" type="submit">Sign in</button></form>'
+                )))
+            if path == "/otp":
+                error = '<span id="input-error-otp-code">Invalid code</span>' if query.get("error") else ""
+                return self._send(200, _page("OTP", (
+                    f'{error}<form method="post" action="/otp"><input id="otp" name="otp">'
+                    '<input type="submit" name="login" value="Verify"></form>'
+                )))
+            if path == "/dashboard":
+                return self._send(200, _page("Dashboard", (
+                    f'<div id="dashboard">Welcome</div><a href="{base_url}/setlocale/en">English</a>'
+                )))
+            if path == "/api/regions":
+                return self._json({code: name for code, (name, _) in REGIONS.items()})
+            if path == "/api/cities":
+                return self._json(REGIONS.get(query.get("region", [""])[0], ("", {}))[1])
+            if path == "/api/asset-usages":
+                return self._json(ASSET_USAGES.get(query.get("asset_type", [""])[0], {}))
+            if path == "/report/create/1/137":
+                return self._send(200, render_step(1, path))
+
+            match = re.fullmatch(r"/report/(\d+)/step/(\d+)", path)
+            if match and int(match.group(1)) in portal.drafts:
+                step_num = int(match.group(2))
+                return self._send(200, render_step(step_num, path))
+            match = re.fullmatch(r"/report/(\d+)", path)
+            if match:
+                return self._send(200, _page("Report", f'<div id="report">Report {match.group(1)} saved</div>'))
+            return self._send(404, _page("Not found", "Not found"))
+
+        def do_POST(self):
+            portal.delay()
+            body = self._read_body()
+            path = urlparse(self.path).path.rstrip("/")
+
+            if path == "/login":
+                return self._send(302, location="/otp")
+            if path == "/otp":
+                otp = parse_qs(body.decode("utf-8", errors="replace")).get("otp", [""])[0]
+                return self._send(302, location="/otp?error=1" if otp == "000000" else "/dashboard")
+
+            if path == "/report/create/1/137":
+                step_num, draft_id = 1, None
+            else:
+                match = re.fullmatch(r"/report/(\d+)/step/(\d+)", path)
+                if not match or int(match.group(1)) not in portal.drafts:
+                    return self._send(404, _page("Not found", "Not found"))
+                draft_id, step_num = int(match.group(1)), int(match.group(2))
+
+            if random.random() < portal.error_rate:
+                return self._send(200, render_step(step_num, path, error=True))
+
+            if draft_id is None:
+                draft_id = portal.new_draft()
+            portal.drafts[draft_id] = step_num
+            if step_num == len(form_steps):
+                portal.saved += 1
+                return self._send(302, location=f"/report/{draft_id}")
+            return self._send(302, location=f"/report/{draft_id}/step/{step_num + 1}")
+
+    return Handler
+
+
+def start_standin(port=8765, latency=0.0, jitter=0.0, error_rate=0.0):
+    """Start the stand-in in a background thread; returns (server, portal)"""
+    portal = StandinPortal(latency, jitter, error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(portal, f"http://127.0.0.1:{port}"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, portal
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the qima create-report portal")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of step submissions answered with a validation error")
+    args = parser.parse_args()
+
+    server, _ = start_standin(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Stand-in portal on http://127.0.0.1:{args.port} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
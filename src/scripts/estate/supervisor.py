@@ -0,0 +1,299 @@
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+from progress import progress_channel
+from transport import open_transport, FrameError, IPC_MAX_FRAME
+from formStore import count_pending_records
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker_taqeem.py")
+FINAL_STATUSES = ("SUCCESS", "FAILED", "STOPPED")
+
+
+class ShardWorker:
+    """One child worker_taqeem process with its own Chrome and profile"""
+
+    def __init__(self, index, count, on_progress):
+        self.index = index
+        self.count = count
+        self.on_progress = on_progress
+        self.process = None
+        self.responses = {}  # child commandId -> queue of responses carrying that id
+        self._ids = itertools.count()
+        self._reader = None
+        self._error = None  # why the child's output can no longer be read
+
+    async def start(self):
+        # Shards always speak JSON lines to the supervisor; only the Node-facing side is framed
+        env = dict(os.environ, WORKER_PROCESSES="1", WORKER_SHARD=str(self.index), IPC_MODE="jsonl", IPC_ENCODING="json")
+        base_profile = os.getenv("USER_DATA_DIR")
+        if base_profile:
+            env["USER_DATA_DIR"] = f"{base_profile}-shard{self.index}"
+
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, WORKER_SCRIPT,
+            cwd=os.path.dirname(WORKER_SCRIPT),
+            env=env,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=None,  # child stderr goes straight to ours
+            limit=IPC_MAX_FRAME  # a batch result with metrics is far over the 64 KiB default line limit
+        )
+        self._reader = asyncio.create_task(self._read_stdout())
+
+    async def _read_stdout(self):
+        error = f"Worker shard {self.index} exited"
+        try:
+            while True:
+                line = await self.process.stdout.readline()
+                if not line:
+                    break
+                text = line.decode("utf-8", errors="replace").strip()
+                if not text:
+                    continue
+                try:
+                    msg = json.loads(text)
+                except json.JSONDecodeError:
+                    print(f"[SHARD {self.index}] {text}", file=sys.stderr)
+                    continue
+
+                if msg.get("type") == "PROGRESS":
+                    self.on_progress(self.index, msg)
+                elif msg.get("commandId") in self.responses:
+                    await self.responses[msg["commandId"]].put(msg)
+                else:
+                    # Debug/warning chatter is forwarded unchanged
+                    progress_channel.send(msg)
+        except Exception as e:
+            error = f"Lost the output of worker shard {self.index}: {e}"
+            print(f"[PY] {error}", file=sys.stderr)
+        finally:
+            # Unblock anyone still waiting on this child; send() fails later commands the same way
+            self._error = error
+            for queue in self.responses.values():
+                queue.put_nowait({"status": "FAILED", "error": error})
+
+    async def send(self, cmd):
+        """Send a command to the child and return the queue its responses arrive on"""
+        command_id = f"shard{self.index}-{next(self._ids)}"
+        queue = asyncio.Queue()
+        self.responses[command_id] = queue
+        if self._error:
+            queue.put_nowait({"status": "FAILED", "error": self._error})
+            return command_id, queue
+        self.process.stdin.write((json.dumps({**cmd, "commandId": command_id}) + "\n").encode("utf-8"))
+        await self.process.stdin.drain()
+        return command_id, queue
+
+    async def request(self, cmd):
+        """Send a command and wait for its single reply"""
+        command_id, queue = await self.send(cmd)
+        try:
+            return await queue.get()
+        finally:
+            self.responses.pop(command_id, None)
+
+    async def stop(self):
+        if self.process and self.process.returncode is None:
+            try:
+                await asyncio.wait_for(self.request({"action": "close"}), 30)
+            except Exception:
+                self.process.kill()
+            await self.process.wait()
+        if self._reader:
+            await self._reader
+
+
+class Supervisor:
+    """Shards every batch across N worker processes and merges their output into one stream"""
+
+    def __init__(self, num_workers):
+        self.workers = [ShardWorker(i, num_workers, self.on_progress) for i in range(num_workers)]
+        self.batches = {}  # batch_id -> {"current": {index: n}, "totals": {index: n}, "num_tabs": n}
+
+    async def start(self):
+        await asyncio.gather(*(worker.start() for worker in self.workers))
+        print(f"[PY] Supervisor started {len(self.workers)} worker processes", file=sys.stderr)
+
+    def on_progress(self, shard_index, msg):
+        batch = self.batches.get(msg.get("batchId"))
+        if batch is None:
+            progress_channel.send(msg)
+            return
+
+        if msg.get("status") == "COMPLETED":
+            # One shard finishing is not the batch finishing; the supervisor emits the real one
+            return
+
+        if msg.get("current") is not None:
+            batch["current"][shard_index] = msg["current"]
+        # Totals were counted per shard up front, so the denominator is right before every shard reports
+        current = sum(batch["current"].values())
+        total = sum(batch["totals"].values())
+        progress_channel.send({**msg, "shard": shard_index, "current": current, "total": total})
+
+    def reply(self, cmd, result):
+        progress_channel.send({**result, "commandId": cmd.get("commandId")})
+
+    async def process_batch(self, cmd):
+        batch_id = cmd.get("batchId")
+        self.batches[batch_id] = {"current": {}, "totals": {}, "num_tabs": cmd.get("numTabs", 1)}
+        try:
+            totals = await asyncio.gather(*(
+                count_pending_records(batch_id, {"index": worker.index, "count": worker.count})
+                for worker in self.workers
+            ))
+            self.batches[batch_id]["totals"] = dict(enumerate(totals))
+            sent = await asyncio.gather(*(
+                worker.send({**cmd, "shard": {"index": worker.index, "count": worker.count}})
+                for worker in self.workers
+            ))
+            acks = await asyncio.gather(*(queue.get() for _, queue in sent))
+            failed = [ack for ack in acks if ack.get("status") != "ACKNOWLEDGED"]
+            if failed:
+                # Don't leave the shards that did start running a partial batch
+                await asyncio.gather(*(
+                    worker.request({"action": "stop", "batchId": batch_id})
+                    for worker, ack in zip(self.workers, acks) if ack.get("status") == "ACKNOWLEDGED"
+                ))
+                self.reply(cmd, {"status": "FAILED", "batchId": batch_id, "error": failed[0].get("error")})
+                return
+
+            self.reply(cmd, {
+                "status": "ACKNOWLEDGED",
+                "message": f"Batch {batch_id} processing started on {len(self.workers)} workers",
+                "batchId": batch_id,
+                "numTabs": cmd.get("numTabs"),
+                "numWorkers": len(self.workers)
+            })
+
+            results = []
+            for _, queue in sent:
+                while True:
+                    result = await queue.get()
+                    if result.get("status") in FINAL_STATUSES:
+                        results.append(result)
+                        break
+            for worker, (command_id, _) in zip(self.workers, sent):
+                worker.responses.pop(command_id, None)
+
+            self.finish_batch(cmd, results)
+        except Exception as e:
+            self.reply(cmd, {"status": "FAILED", "batchId": batch_id, "error": str(e), "traceback": traceback.format_exc()})
+        finally:
+            self.batches.pop(batch_id, None)
+
+    def finish_batch(self, cmd, results):
+        batch_id = cmd.get("batchId")
+        statuses = {result.get("status") for result in results}
+        merged = {
+            "batchId": batch_id,
+            "successful_records": sum(r.get("successful_records", 0) for r in results),
+            "failed_records": sum(r.get("failed_records", 0) for r in results),
+            "total_records": sum(r.get("total_records", 0) for r in results),
+            "tabs_used": sum(r.get("tabs_used", 0) for r in results),
+            "workers": len(results)
+        }
+
+        if "STOPPED" in statuses:
+            self.reply(cmd, {**merged, "status": "STOPPED", "message": "Task was stopped by user"})
+            return
+        if "FAILED" in statuses:
+            errors = [r.get("error") for r in results if r.get("status") == "FAILED"]
+            self.reply(cmd, {**merged, "status": "FAILED", "error": "; ".join(str(e) for e in errors)})
+            return
+
+        progress_channel.send({
+            "type": "PROGRESS",
+            "batchId": batch_id,
+            "status": "COMPLETED",
+            "message": f"Batch {batch_id} processed successfully using {len(results)} workers",
+            "current": merged["total_records"],
+            "total": merged["total_records"],
+            "percentage": 100,
+            "numTabs": merged["tabs_used"],
+            "timestamp": time.time(),
+            "failed_records": merged["failed_records"]
+        })
+        self.reply(cmd, {**merged, "status": "SUCCESS"})
+
+    async def broadcast(self, cmd):
+        """Send a control command to every worker and reply once"""
+        replies = await asyncio.gather(*(worker.request(cmd) for worker in self.workers))
+        # A shard that already finished its part of the batch has no task left to control
+        applied = [r for r in replies if r.get("status") != "FAILED"]
+        if applied:
+            self.reply(cmd, {**applied[0], "workers": len(applied)})
+        else:
+            self.reply(cmd, replies[0])
+
+    async def share_session(self):
+        """Copy shard 0's logged-in session into every other shard; returns how many took it"""
+        exported = await self.workers[0].request({"action": "exportSession"})
+        if exported.get("status") != "SUCCESS":
+            print(f"[PY] Session export from shard 0 failed: {exported.get('error')}", file=sys.stderr)
+            return 0
+        replies = await asyncio.gather(*(
+            worker.request({"action": "importSession", "session": exported["session"]})
+            for worker in self.workers[1:]
+        ))
+        for worker, reply in zip(self.workers[1:], replies):
+            if reply.get("status") != "SUCCESS":
+                print(f"[PY] Shard {worker.index} could not restore the session: {reply.get('error')}", file=sys.stderr)
+        return sum(1 for reply in replies if reply.get("status") == "SUCCESS")
+
+    async def handle(self, cmd):
+        action = cmd.get("action")
+        try:
+            if action == "processTaqeemBatch":
+                asyncio.create_task(self.process_batch(cmd))
+            elif action in ["pause", "resume", "stop"]:
+                await self.broadcast(cmd)
+            elif action in ["login", "otp"]:
+                # The OTP is bound to one browser; the other shards get the session it produced
+                reply = await self.workers[0].request(cmd)
+                if reply.get("status") in ("SUCCESS", "LOGIN_SUCCESS"):
+                    reply["sharedWith"] = await self.share_session()
+                self.reply(cmd, reply)
+            elif action == "ping":
+                self.reply(cmd, {"status": "SUCCESS", "message": "pong", "workers": len(self.workers)})
+            else:
+                self.reply(cmd, {
+                    "status": "FAILED",
+                    "error": f"Unknown action: {action}",
+                    "supported_actions": ["processTaqeemBatch", "login", "otp", "close", "ping", "pause", "resume", "stop"]
+                })
+        except Exception as e:
+            self.reply(cmd, {"status": "FAILED", "error": str(e), "traceback": traceback.format_exc()})
+
+    async def stop(self):
+        await asyncio.gather(*(worker.stop() for worker in self.workers), return_exceptions=True)
+
+
+async def supervise(num_workers):
+    """Entry point for WORKER_PROCESSES > 1: same stdin/stdout protocol as a single worker"""
+    supervisor = Supervisor(num_workers)
+    await supervisor.start()
+    transport = await open_transport(progress_channel)
+    try:
+        while True:
+            try:
+                cmd = await transport.read()
+            except FrameError as e:
+                progress_channel.send({"status": "FAILED", "error": str(e), "received": e.received})
+                continue
+            if cmd is None:
+                break
+
+            print(f"[PY] Supervisor received action: {cmd.get('action')}", file=sys.stderr)
+            if cmd.get("action") == "close":
+                await supervisor.stop()
+                supervisor.reply(cmd, {"status": "SUCCESS", "message": "Browser closed successfully"})
+                return
+            await supervisor.handle(cmd)
+    finally:
+        await supervisor.stop()
+        progress_channel.close()
@@ -0,0 +1,51 @@
+"""Per-tab bookkeeping of the worker, kept beside the tab instead of on it.
+
+Every module that needs to remember something about a tab (records filled,
+a pending recycle, its readiness tracker, what was installed in it) reads
+and writes that tab's TabState from here rather than the Tab's own
+attributes. nodriver's Tab defines __eq__ without __hash__, so it can't key
+a WeakKeyDictionary; states are keyed by id() instead and dropped by a weak
+finalizer once the tab itself is gone.
+"""
+import weakref
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+@dataclass
+class TabState:
+    records_done: int = 0  # records filled since the tab was opened or last recycled
+    recycle: Optional[str] = None  # why the tab should be replaced before its next record
+    readiness: Any = None  # readiness.PageReadiness following the tab's CDP events
+    interception: Any = None  # interception.PageInterception, when RESOURCE_BLOCKING is on
+    injection_installed: bool = False  # fill runtime registered for every new document
+    performance_enabled: bool = False  # CDP Performance domain on, for memory samples
+    own_context: bool = False  # opened in a browser context of its own (TAB_ISOLATION=context)
+    blank_form_at: Optional[float] = None  # time.monotonic() the standby pool loaded the blank form
+
+
+class TabStates:
+    """One TabState per live tab"""
+
+    def __init__(self):
+        self._states = {}  # id(tab) -> TabState
+
+    def get(self, tab):
+        """The tab's state, created on first use"""
+        key = id(tab)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = TabState()
+            # Runs when the tab is collected, before its id can be handed to another object
+            weakref.finalize(tab, self._states.pop, key, None)
+        return state
+
+    def __len__(self):
+        return len(self._states)
+
+
+tab_states = TabStates()
+
+
+def tab_state(tab):
+    return tab_states.get(tab)
@@ -0,0 +1,38 @@
+"""Shared fixtures for the worker's tests.
+
+Run from src/scripts/estate with `python -m pytest tests`. The worker's
+modules import each other as top-level modules, so this directory's parent
+goes on sys.path. Tabs come from the in-memory fakeBrowser backend and
+progress events are collected in memory instead of going to stdout.
+"""
+import os
+import sys
+
+# Set before the worker's modules read them at import time
+os.environ.setdefault("BROWSER_BACKEND", "fake")
+os.environ.setdefault("STANDBY_TABS", "0")
+os.environ.setdefault("SUBMIT_BACKEND", "browser")
+os.environ.setdefault("NETWORK_IDLE_TIME", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fakeBrowser import FakeBrowser
+from progress import progress_channel
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """Every progress event emitted during the test, in order"""
+    emitted = []
+    monkeypatch.setattr(progress_channel, "emit", emitted.append)
+    return emitted
+
+
+@pytest.fixture
+def fake_browser():
+    return FakeBrowser()
+
+
+def statuses(events, status):
+    return [event for event in events if event.get("status") == status]
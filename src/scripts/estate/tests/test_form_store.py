@@ -0,0 +1,98 @@
+import asyncio
+from pymongo import UpdateOne
+from formStore import FormWriter
+
+
+class MemoryCollection:
+    """Records bulk_write calls; fails the next `failures` of them"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.writes = []
+
+    async def bulk_write(self, requests, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("mongo unreachable")
+        self.writes.append(list(requests))
+
+
+def test_updates_to_one_record_are_merged_into_one_write():
+    collection = MemoryCollection()
+    writer = FormWriter(collection, max_delay=60)
+
+    async def run():
+        writer.set(1, {"draft_id": "d1", "last_step": 1})
+        writer.set(1, {"last_step": 2})
+        writer.set(2, {"form_id": "f2"})
+        assert await writer.close()
+
+    asyncio.run(run())
+
+    assert collection.writes == [[
+        UpdateOne({"_id": 1}, {"$set": {"draft_id": "d1", "last_step": 2}}),
+        UpdateOne({"_id": 2}, {"$set": {"form_id": "f2"}}),
+    ]]
+
+
+def test_full_buffer_is_written_without_waiting_for_the_interval():
+    collection = MemoryCollection()
+    writer = FormWriter(collection, max_batch=2, max_delay=60)
+
+    async def run():
+        writer.set(1, {"last_step": 1})
+        writer.set(2, {"last_step": 1})
+        await asyncio.sleep(0.05)
+        written = len(collection.writes)
+        await writer.close()
+        return written
+
+    assert asyncio.run(run()) == 1
+
+
+def test_failed_write_is_kept_and_newer_fields_win():
+    collection = MemoryCollection(failures=1)
+    writer = FormWriter(collection, max_delay=60)
+
+    async def run():
+        writer.set(1, {"last_step": 1, "draft_id": "d1"})
+        writer._ensure_started()
+        assert not await writer.flush()
+        writer.set(1, {"last_step": 2})
+        assert await writer.flush()
+        await writer.close()
+
+    asyncio.run(run())
+
+    assert collection.writes == [[UpdateOne({"_id": 1}, {"$set": {"last_step": 2, "draft_id": "d1"}})]]
+
+
+def test_drain_retries_and_reports_the_form_ids_it_could_not_write(capsys):
+    collection = MemoryCollection(failures=10)
+    writer = FormWriter(collection, max_delay=60)
+
+    async def run():
+        writer.set("a", {"form_id": "f1"})
+        writer.set("b", {"last_step": 2})
+        drained = await writer.drain(attempts=3, delay=0)
+        unwritten = writer.unwritten(["a", "b", "c"])
+        closed = await writer.close(attempts=1)
+        return drained, unwritten, closed
+
+    assert asyncio.run(run()) == (False, ["a"], False)
+    assert collection.failures == 6
+    assert "Dropping 2 unwritten record updates: ['a', 'b']" in capsys.readouterr().err
+
+
+def test_drain_succeeds_once_mongo_is_back():
+    collection = MemoryCollection(failures=2)
+    writer = FormWriter(collection, max_delay=60)
+
+    async def run():
+        writer.set("a", {"form_id": "f1"})
+        drained = await writer.drain(attempts=3, delay=0)
+        await writer.close()
+        return drained, writer.unwritten(["a"])
+
+    assert asyncio.run(run()) == (True, [])
+    assert collection.writes == [[UpdateOne({"_id": "a"}, {"$set": {"form_id": "f1"}})]]
@@ -0,0 +1,77 @@
+import asyncio
+import io
+import json
+from progress import ProgressChannel
+
+
+def written(stream):
+    return [json.loads(line) for line in stream.getvalue().decode("utf-8").splitlines()]
+
+
+def step(tab_id, n, batch_id="b"):
+    return {"type": "PROGRESS", "status": "STEP_PROGRESS", "batchId": batch_id, "tab_id": tab_id, "step": n}
+
+
+def test_per_tab_events_are_merged_into_the_latest_one():
+    stream = io.BytesIO()
+    channel = ProgressChannel(interval=0.05, stream=stream)
+
+    async def run():
+        for n in range(10):
+            channel.emit(step(1, n))
+        channel.emit(step(2, 0))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    channel.close()
+
+    messages = written(stream)
+    assert [(m["tab_id"], m["step"], m.get("coalesced")) for m in messages] == [(1, 9, 9), (2, 0, None)]
+    assert channel.coalesced == 9
+
+
+def test_terminal_event_goes_out_at_once_after_its_batch_pending_events():
+    stream = io.BytesIO()
+    channel = ProgressChannel(interval=60, stream=stream)
+
+    async def run():
+        channel.emit(step(1, 1, batch_id="a"))
+        channel.emit(step(1, 1, batch_id="b"))
+        channel.emit({"type": "PROGRESS", "status": "RECORD_SUCCESS", "batchId": "a", "tab_id": 1})
+
+    asyncio.run(run())
+    channel.close(timeout=1)
+
+    messages = written(stream)
+    # Batch b's snapshot was still waiting for the timer and only went out with close()
+    assert [(m["batchId"], m["status"]) for m in messages] == [
+        ("a", "STEP_PROGRESS"), ("a", "RECORD_SUCCESS"), ("b", "STEP_PROGRESS")
+    ]
+
+
+def test_replies_flush_their_batch_first():
+    stream = io.BytesIO()
+    channel = ProgressChannel(interval=60, stream=stream)
+
+    async def run():
+        channel.emit(step(1, 3))
+        channel.send({"status": "SUCCESS", "batchId": "b", "commandId": 7})
+
+    asyncio.run(run())
+    channel.close(timeout=1)
+
+    assert [m["status"] for m in written(stream)] == ["STEP_PROGRESS", "SUCCESS"]
+
+
+def test_zero_interval_sends_every_event():
+    stream = io.BytesIO()
+    channel = ProgressChannel(interval=0, stream=stream)
+
+    async def run():
+        for n in range(3):
+            channel.emit(step(1, n))
+
+    asyncio.run(run())
+    channel.close(timeout=1)
+
+    assert [m["step"] for m in written(stream)] == [0, 1, 2]
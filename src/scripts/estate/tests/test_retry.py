@@ -0,0 +1,80 @@
+import asyncio
+from nodriver.core.connection import ProtocolException
+from retry import CircuitBreaker, PortalFailure, classify, TIMEOUT, NAVIGATION, PORTAL_ERROR, VALIDATION, UNKNOWN
+
+
+def test_classify_goes_by_exception_type_and_cdp_code():
+    assert classify(PortalFailure(PORTAL_ERROR, "Portal returned HTTP 502")) == PORTAL_ERROR
+    assert classify(asyncio.TimeoutError()) == TIMEOUT
+    assert classify(ProtocolException({"code": -32000, "message": "Cannot find context with specified id"})) == NAVIGATION
+    assert classify(ConnectionResetError()) == NAVIGATION
+    assert classify(ProtocolException({"code": -32602, "message": "Invalid parameters"})) == UNKNOWN
+
+
+def test_classify_never_reads_the_message():
+    # Used to come out as a transient timeout because of "not found"
+    assert classify(RuntimeError("validation failed: region not found")) == UNKNOWN
+    assert classify(ValueError("connection timed out")) == UNKNOWN
+
+
+def test_breaker_opens_after_threshold_portal_failures():
+    breaker = CircuitBreaker(threshold=3, window=60, cooldown=30)
+
+    assert not breaker.record(TIMEOUT)
+    assert not breaker.record(PORTAL_ERROR)
+    assert breaker.record(TIMEOUT)
+    assert breaker.state == "open"
+    assert breaker.trips == 1
+
+
+def test_success_and_record_failures_do_not_count_towards_the_threshold():
+    breaker = CircuitBreaker(threshold=2, window=60, cooldown=30)
+
+    breaker.record(TIMEOUT)
+    breaker.record()  # the portal answered
+    breaker.record(TIMEOUT)
+    breaker.record(VALIDATION)  # the record's fault, not the portal's
+
+    assert breaker.state == "closed"
+
+
+def test_failures_outside_the_window_are_forgotten():
+    breaker = CircuitBreaker(threshold=2, window=0.05, cooldown=30)
+
+    async def run():
+        breaker.record(TIMEOUT)
+        await asyncio.sleep(0.1)
+        return breaker.record(TIMEOUT)
+
+    assert not asyncio.run(run())
+    assert breaker.state == "closed"
+
+
+def test_probe_success_closes_the_breaker_and_releases_waiting_tabs():
+    breaker = CircuitBreaker(threshold=1, window=60, cooldown=0.2)
+
+    async def run():
+        breaker.record(TIMEOUT)
+        await asyncio.wait_for(breaker.wait(), 1)  # this caller is the probe
+        assert breaker.state == "half_open"
+        waiter = asyncio.create_task(breaker.wait())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        breaker.record()
+        await asyncio.wait_for(waiter, 1)
+        return breaker.state
+
+    assert asyncio.run(run()) == "closed"
+
+
+def test_probe_failure_reopens_the_breaker():
+    breaker = CircuitBreaker(threshold=1, window=60, cooldown=0.05)
+
+    async def run():
+        breaker.record(TIMEOUT)
+        await asyncio.wait_for(breaker.wait(), 1)
+        return breaker.record(PORTAL_ERROR)
+
+    assert asyncio.run(run())
+    assert breaker.state == "open"
+    assert breaker.trips == 2
@@ -0,0 +1,81 @@
+import asyncio
+from scheduler import TabScheduler
+from conftest import statuses
+
+
+def test_spare_tabs_follow_priority_weight(events):
+    async def run():
+        scheduler = TabScheduler(6)
+        low = await scheduler.admit("low", 10, priority=0)
+        high = await scheduler.admit("high", 10, priority=1)
+        return low.tabs, high.tabs
+
+    # Weights 1 and 2 split six tabs 2:4
+    assert asyncio.run(run()) == (2, 4)
+
+
+def test_batch_never_gets_more_than_it_asked_for(events):
+    async def run():
+        scheduler = TabScheduler(5)
+        small = await scheduler.admit("small", 1)
+        large = await scheduler.admit("large", 10)
+        return small.tabs, large.tabs
+
+    assert asyncio.run(run()) == (1, 4)
+
+
+def test_running_batches_are_rebalanced_when_one_joins_and_leaves(events):
+    async def run():
+        scheduler = TabScheduler(4)
+        first = await scheduler.admit("first", 4)
+        changes = []
+        first.on_change = changes.append
+        await scheduler.admit("second", 4)
+        scheduler.release("second")
+        return first.tabs, changes
+
+    assert asyncio.run(run()) == (4, [2, 4])
+
+
+def test_queued_batch_is_admitted_when_a_tab_frees_up(events):
+    async def run():
+        scheduler = TabScheduler(1)
+        await scheduler.admit("first", 3)
+        waiting = asyncio.create_task(scheduler.admit("second", 3))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        scheduler.release("first")
+        slot = await asyncio.wait_for(waiting, 1)
+        return slot.batch_id, slot.tabs, list(scheduler.active)
+
+    assert asyncio.run(run()) == ("second", 1, ["second"])
+    queued = statuses(events, "QUEUED")
+    assert [(event["batchId"], event["queue_position"]) for event in queued] == [("second", 1)]
+
+
+def test_higher_priority_batches_leave_the_queue_first(events):
+    async def run():
+        scheduler = TabScheduler(1)
+        await scheduler.admit("running", 1)
+        normal = asyncio.create_task(scheduler.admit("normal", 1))
+        await asyncio.sleep(0)
+        urgent = asyncio.create_task(scheduler.admit("urgent", 1, priority=5))
+        await asyncio.sleep(0)
+        scheduler.release("running")
+        await asyncio.wait_for(urgent, 1)
+        return normal.done(), list(scheduler.active)
+
+    assert asyncio.run(run()) == (False, ["urgent"])
+
+
+def test_free_tabs_is_what_the_batches_were_not_allotted(events):
+    async def run():
+        scheduler = TabScheduler(6)
+        free = [scheduler.free_tabs()]
+        await scheduler.admit("small", 2)
+        free.append(scheduler.free_tabs())
+        await scheduler.admit("large", 10)
+        free.append(scheduler.free_tabs())
+        return free
+
+    assert asyncio.run(run()) == [6, 4, 0]
@@ -0,0 +1,34 @@
+import asyncio
+from standby import StandbyPool
+
+
+def test_pool_only_fills_the_tabs_the_budget_leaves(fake_browser):
+    pool = StandbyPool(size=3)
+    free = [2]
+    pool.free_tabs = lambda: free[0]
+
+    async def run():
+        pool.fill(fake_browser)
+        await asyncio.sleep(0.1)
+        ready = len(pool._ready)
+        # Every free tab is a standby tab now, so a prefetch would exceed the budget
+        free[0] = 1
+        prefetched = pool.prefetch(fake_browser)
+        return ready, prefetched
+
+    ready, prefetched = asyncio.run(run())
+    assert ready == 2
+    assert len(fake_browser.tabs) == 3  # the main tab and two standby tabs
+    assert prefetched.result() is not None  # a ready standby tab is handed over without opening another
+
+
+def test_prefetch_is_refused_without_budget(fake_browser):
+    pool = StandbyPool(size=2)
+    pool.free_tabs = lambda: 0
+
+    async def run():
+        pool.fill(fake_browser)
+        return pool.prefetch(fake_browser)
+
+    assert asyncio.run(run()) is None
+    assert len(fake_browser.tabs) == 1
@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+import browser
+import formFiller
+from formFiller import TabPool, ProgressTracker
+from conftest import statuses
+
+
+class ScriptedForm:
+    """Stands in for fill_form: every step succeeds at once unless the test scripted a stall for it"""
+
+    def __init__(self):
+        self.saved = []  # (record _id, page) in save order
+        self.stalls = {}  # (record _id, "step" or "save") -> seconds to stall, None for forever
+        self.pages = {}  # record _id -> pages it was filled on
+
+    async def fill_form(self, page, record, field_map, field_types, is_last_step=False, **kwargs):
+        self.pages.setdefault(record["_id"], []).append(page)
+        phase = "save" if is_last_step else "step"
+        if (record["_id"], phase) in self.stalls:
+            seconds = self.stalls.pop((record["_id"], phase))
+            await asyncio.sleep(seconds) if seconds is not None else await asyncio.Event().wait()
+        if not is_last_step:
+            return True
+        record["form_id"] = f"form-{record['_id']}"
+        self.saved.append((record["_id"], page))
+        return {"status": "SAVED", "form_id": record["form_id"]}
+
+
+@pytest.fixture
+def form(monkeypatch):
+    scripted = ScriptedForm()
+
+    async def open_record(page, record):
+        return 1
+
+    async def save_checkpoint(page, record, step_num):
+        pass
+
+    monkeypatch.setattr(formFiller, "fill_form", scripted.fill_form)
+    monkeypatch.setattr(formFiller, "open_record", open_record)
+    monkeypatch.setattr(formFiller, "save_checkpoint", save_checkpoint)
+    monkeypatch.setattr(formFiller, "HANG_DEFAULT_SECONDS", 0.2)
+    monkeypatch.setattr(formFiller, "HANG_CHECK_INTERVAL", 0.02)
+    return scripted
+
+
+def run_pool(fake_browser, count, tabs):
+    async def run():
+        queue = asyncio.Queue()
+        for i in range(count):
+            queue.put_nowait({"_id": i})
+        queue.put_nowait(None)
+        tracker = ProgressTracker(count, tabs)
+        pool = TabPool(fake_browser, queue, "batch", None, count, tracker, target=tabs, retry_queue=[])
+        results = await asyncio.wait_for(pool.run(), 10)
+        return pool, tracker, results
+
+    return asyncio.run(run())
+
+
+def test_records_are_shared_between_tabs(fake_browser, form, events):
+    pool, tracker, results = run_pool(fake_browser, 8, 3)
+
+    assert sorted(record_id for record_id, _ in form.saved) == list(range(8))
+    assert sum(result["success"] for result in results) == 8
+    assert tracker.completed_records == 8
+    assert pool.tabs_used == 3
+
+
+def test_hung_record_is_reassigned_to_another_tab(fake_browser, form, events):
+    form.stalls[(0, "step")] = None
+
+    pool, tracker, results = run_pool(fake_browser, 6, 2)
+
+    hung = statuses(events, "TAB_HUNG")
+    assert [event["action"] for event in hung] == ["reassign"]
+    assert hung[0]["recordId"] == "0"
+    # Saved exactly once, and not by the tab that hung on it
+    assert sorted(record_id for record_id, _ in form.saved) == list(range(6))
+    hung_page = form.pages[0][0]
+    assert dict(form.saved)[0] is not hung_page
+    assert tracker.completed_records == 6
+    assert sum(result["success"] for result in results) == 6
+
+
+def test_tab_stalled_while_saving_is_left_alone(fake_browser, form, events):
+    form.stalls[(0, "save")] = 0.4
+
+    pool, tracker, results = run_pool(fake_browser, 4, 2)
+
+    hung = statuses(events, "TAB_HUNG")
+    assert [event["action"] for event in hung] == ["wait"]
+    assert [record_id for record_id, _ in form.saved].count(0) == 1
+    assert not pool.reassigned
+    assert tracker.completed_records == 4
+
+
+def test_hung_main_tab_is_recycled_before_its_next_record(fake_browser, form, events):
+    form.stalls[(0, "step")] = None
+
+    pool, tracker, results = run_pool(fake_browser, 3, 1)
+
+    recycled = statuses(events, "TAB_RECYCLED")
+    assert [event["reason"] for event in recycled] == ["hung"]
+    # The main tab is parked and the reassigned record finished on the fresh tab
+    assert dict(form.saved)[0] is not fake_browser.main_tab
+    assert fake_browser.main_tab.url == "about:blank"
+    assert browser.needs_recycle(fake_browser.main_tab) is None
+    assert sorted(record_id for record_id, _ in form.saved) == [0, 1, 2]
+
+
+def test_tab_is_recycled_after_its_record_allowance(fake_browser, form, events, monkeypatch):
+    monkeypatch.setattr(browser, "TAB_RECYCLE_RECORDS", 2)
+
+    pool, tracker, results = run_pool(fake_browser, 5, 1)
+
+    recycled = statuses(events, "TAB_RECYCLED")
+    assert [event["reason"] for event in recycled] == ["2 records", "2 records"]
+    pages = [page for _, page in form.saved]
+    assert pages[0] is pages[1] is fake_browser.main_tab
+    assert pages[2] is pages[3] is not pages[4]
+    assert tracker.completed_records == 5
@@ -0,0 +1,34 @@
+import gc
+from tabState import TabStates
+
+
+class UnhashableTab:
+    """Like nodriver's Tab: __eq__ without __hash__"""
+
+    def __init__(self, target):
+        self.target = target
+
+    def __eq__(self, other):
+        return getattr(other, "target", None) == self.target
+
+
+def test_each_tab_has_its_own_state_even_when_tabs_compare_equal():
+    states = TabStates()
+    first, second = UnhashableTab("t"), UnhashableTab("t")
+
+    states.get(first).records_done = 3
+
+    assert states.get(first).records_done == 3
+    assert states.get(second).records_done == 0
+
+
+def test_state_is_dropped_with_its_tab():
+    states = TabStates()
+    tab = UnhashableTab("t")
+    states.get(tab).recycle = "hung"
+    assert len(states) == 1
+
+    del tab
+    gc.collect()
+
+    assert len(states) == 0
@@ -0,0 +1,73 @@
+import asyncio
+import struct
+import pytest
+import transport
+from transport import Transport, FrameError, decode
+
+
+def read_all(t, data):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        t._reader = reader
+        messages = []
+        while (message := await t.read()) is not None:
+            messages.append(message)
+        return messages
+
+    return asyncio.run(run())
+
+
+def test_framed_json_round_trip():
+    t = Transport("framed", "json")
+    message = {"action": "processTaqeemBatch", "reportIds": list(range(1000)), "name": "تقييم"}
+
+    frame = t.encode(message)
+
+    (length,) = struct.unpack(">I", frame[:4])
+    assert length == len(frame) - 4
+    assert frame[4:5] == b"j"
+    assert decode(frame[4:5], frame[5:]) == message
+    assert read_all(t, frame + t.encode({"action": "ping"})) == [message, {"action": "ping"}]
+
+
+def test_framed_msgpack_round_trip():
+    pytest.importorskip("msgpack")
+    t = Transport("framed", "msgpack")
+
+    frame = t.encode({"status": "SUCCESS", "commandId": 3})
+
+    assert frame[4:5] == b"m"
+    assert read_all(t, frame) == [{"status": "SUCCESS", "commandId": 3}]
+
+
+def test_frame_length_out_of_range_is_fatal(monkeypatch):
+    monkeypatch.setattr(transport, "IPC_MAX_FRAME", 16)
+    t = Transport("framed", "json")
+
+    with pytest.raises(EOFError):
+        read_all(t, struct.pack(">I", 17) + b"j" + b"x" * 16)
+
+
+def test_truncated_frame_reads_as_end_of_input():
+    t = Transport("framed", "json")
+    frame = t.encode({"action": "ping"})
+
+    assert read_all(t, frame[:-2]) == []
+
+
+def test_undecodable_frame_carries_what_was_received():
+    with pytest.raises(FrameError) as error:
+        decode(b"j", b"{not json")
+
+    assert error.value.received == "{not json"
+
+
+def test_jsonl_skips_blank_lines_and_reports_bad_ones():
+    t = Transport("jsonl")
+
+    assert read_all(t, b'{"action": "ping"}\n\n{"action": "close"}\n') == [{"action": "ping"}, {"action": "close"}]
+    with pytest.raises(FrameError) as error:
+        read_all(t, b"not json\n")
+    assert error.value.received == "not json"
@@ -0,0 +1,138 @@
+"""stdin/stdout transport between pythonWorkerService.js and the worker.
+
+IPC_MODE=jsonl (the default and fallback) keeps the original one JSON
+object per line. IPC_MODE=framed sends length-prefixed frames:
+
+    [4-byte big-endian length][1 codec byte: "j" JSON / "m" msgpack][payload]
+
+In framed mode the transport takes over the real stdout and points fd 1
+at stderr, so stray prints and tracebacks can never corrupt a frame.
+Replies are encoded with msgpack when IPC_ENCODING=msgpack and the
+package is installed; incoming frames are decoded by their codec byte.
+"""
+import asyncio
+import json
+import os
+import struct
+import sys
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+IPC_MODE = os.getenv("IPC_MODE", "jsonl").lower()
+IPC_ENCODING = os.getenv("IPC_ENCODING", "json").lower()
+# Also the StreamReader buffer limit, so a batch command with many report ids still fits a line
+IPC_MAX_FRAME = int(os.getenv("IPC_MAX_FRAME", str(16 * 1024 * 1024)))
+
+_HEADER = struct.Struct(">I")
+
+
+class FrameError(ValueError):
+    """An incoming line or frame that could not be decoded; carries what was received"""
+
+    def __init__(self, message, received=""):
+        super().__init__(message)
+        self.received = received
+
+
+class Transport:
+    def __init__(self, mode=IPC_MODE, encoding=IPC_ENCODING):
+        self.mode = mode if mode in ("jsonl", "framed") else "jsonl"
+        self.codec = b"m" if encoding == "msgpack" and msgpack is not None and self.mode == "framed" else b"j"
+        if encoding == "msgpack" and self.codec != b"m":
+            print(f"[PY] msgpack unavailable in {self.mode} mode, replying with JSON", file=sys.stderr)
+        self.out = None  # binary stream replies are written to; None means sys.stdout at write time
+        self._reader = None
+
+    async def open(self):
+        """Attach to stdin with an asyncio StreamReader, falling back to a reader thread where pipes are unsupported"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=IPC_MAX_FRAME)
+        try:
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            self._reader = reader
+        except (NotImplementedError, ValueError, OSError) as e:
+            print(f"[PY] stdin is not a pipe ({e}), reading commands on a thread", file=sys.stderr)
+
+        if self.mode == "framed":
+            # Keep the real stdout for frames; everything else that writes to fd 1 lands on stderr
+            sys.stdout.flush()
+            out_fd = os.dup(sys.stdout.fileno())
+            os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+            self.out = os.fdopen(out_fd, "wb")
+        print(f"[PY] IPC transport: {self.mode}, codec {self.codec.decode()}", file=sys.stderr)
+        return self
+
+    async def _readline(self):
+        if self._reader:
+            return await self._reader.readline()
+        return await asyncio.get_running_loop().run_in_executor(None, sys.stdin.buffer.readline)
+
+    async def _readexactly(self, n):
+        if self._reader:
+            try:
+                return await self._reader.readexactly(n)
+            except asyncio.IncompleteReadError:
+                return b""
+        data = await asyncio.get_running_loop().run_in_executor(None, sys.stdin.buffer.read, n)
+        return data if len(data) == n else b""
+
+    async def read(self):
+        """Next command from Node; None at end of input, FrameError for one that does not decode"""
+        if self.mode == "jsonl":
+            while True:
+                line = await self._readline()
+                if not line:
+                    return None
+                text = line.decode("utf-8", errors="replace").strip()
+                if not text:
+                    continue
+                try:
+                    return json.loads(text)
+                except json.JSONDecodeError as e:
+                    raise FrameError(f"Invalid JSON: {e}", text)
+
+        header = await self._readexactly(_HEADER.size)
+        if not header:
+            return None
+        (length,) = _HEADER.unpack(header)
+        if not 0 < length <= IPC_MAX_FRAME:
+            # The stream can't be resynchronised after a bad length
+            raise EOFError(f"Frame length {length} out of range")
+        frame = await self._readexactly(length)
+        if not frame:
+            return None
+        return decode(frame[:1], frame[1:])
+
+    def encode(self, msg):
+        """Bytes of one outgoing message in this transport's format"""
+        if self.mode == "jsonl":
+            return (json.dumps(msg, default=str) + "\n").encode("utf-8")
+        if self.codec == b"m":
+            payload = msgpack.packb(msg, default=str)
+        else:
+            payload = json.dumps(msg, default=str).encode("utf-8")
+        return _HEADER.pack(len(payload) + 1) + self.codec + payload
+
+
+def decode(codec, payload):
+    try:
+        if codec == b"m":
+            if msgpack is None:
+                raise FrameError("Received a msgpack frame but msgpack is not installed")
+            return msgpack.unpackb(payload)
+        return json.loads(payload.decode("utf-8"))
+    except FrameError:
+        raise
+    except Exception as e:
+        raise FrameError(f"Undecodable frame: {e}", payload[:200].decode("utf-8", errors="replace"))
+
+
+async def open_transport(channel):
+    """Open the stdin/stdout transport and route the channel's writes through it"""
+    transport = await Transport().open()
+    channel.encode = transport.encode
+    channel.stream = transport.out
+    return transport
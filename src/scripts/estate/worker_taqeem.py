@@ -1,53 +1,33 @@
 import asyncio
+import os
 import sys
-import json
 import traceback
 import platform
 from login import startLogin, submitOtp
-from browser import closeBrowser, get_browser
+from browser import closeBrowser, get_browser, LOGIN_URL
 from formFiller import runFormFill
+from formStore import form_writer
+from scheduler import scheduler
+from concurrency import AUTO_TABS_MAX
+from progress import progress_channel
+from transport import open_transport, FrameError
+from session import capture_session, get_session, set_session, restore_session
+from standby import standby_pool, PREWARM_BROWSER
+from control import control_registry, TaskStoppedException
+from httpSubmit import http_submitter
 
 if platform.system().lower() == "windows":
     sys.stdout.reconfigure(encoding="utf-8")
     sys.stderr.reconfigure(encoding="utf-8")
 
-# Task control management
-_task_controls = {}
-_active_tasks = {}  # Track running tasks
-
-class TaskStoppedException(Exception):
-    """Raised when task is stopped"""
-    pass
-
-def create_control_state(task_id, batch_id=None):
-    """Create a new control state for a task"""
-    _task_controls[task_id] = {
-        "paused": False,
-        "stopped": False,
-        "batch_id": batch_id
-    }
-    return _task_controls[task_id]
-
-def get_control_state(task_id):
-    """Get control state for a task"""
-    return _task_controls.get(task_id)
+# Set by supervisor.py for its child processes; session export/import is only accepted there
+WORKER_SHARD = os.environ.get("WORKER_SHARD")
 
-def cleanup_control_state(task_id):
-    """Remove control state when task completes"""
-    if task_id in _task_controls:
-        del _task_controls[task_id]
-    if task_id in _active_tasks:
-        del _active_tasks[task_id]
+_active_tasks = {}  # Track running tasks
 
-async def check_control(state):
-    """Check if we should pause or stop"""
-    if state.get("stopped"):
-        raise TaskStoppedException("Task was stopped by user")
-    
-    while state.get("paused"):
-        await asyncio.sleep(0.5)
-        if state.get("stopped"):
-            raise TaskStoppedException("Task was stopped by user")
+# Standby and prefetched tabs only use what the running batches leave of the tab budget
+standby_pool.free_tabs = scheduler.free_tabs
+_prewarm_task = None
 
 async def process_batch_task(cmd):
     """Process batch in background task"""
@@ -56,15 +36,21 @@ async def process_batch_task(cmd):
         report_ids = cmd.get("reportIds", [])
         num_tabs = cmd.get("numTabs", 1)  # ADD THIS LINE
         socket_mode = cmd.get("socketMode", False)
+        shard = cmd.get("shard")  # set by the supervisor when batches are split across processes
+        priority = cmd.get("priority", 0)
         
         print(f"[PY] Starting batch processing: {batch_id} with {len(report_ids)} reports using {num_tabs} tabs", file=sys.stderr)
         
+        # Create control state for this task
+        control_state = control_registry.create(batch_id)
+        
+        # Wait for a share of the worker's tab budget; other batches may be using all of it
+        # An "auto" batch asks for as many tabs as the controller may ever use
+        tab_slot = await scheduler.admit(batch_id, AUTO_TABS_MAX if num_tabs == "auto" else num_tabs, priority)
+        
         # Get browser instance
         browser = await get_browser()
         
-        # Create control state for this task
-        control_state = create_control_state(batch_id, batch_id)
-        
         # Emit start progress
         if socket_mode:
             progress_data = {
@@ -78,10 +64,10 @@ async def process_batch_task(cmd):
                 "numTabs": num_tabs,  # ADD THIS
                 "timestamp": asyncio.get_event_loop().time()
             }
-            print(json.dumps(progress_data), flush=True)
+            progress_channel.emit(progress_data)
         
         # Process the batch - PASS num_tabs parameter
-        result = await runFormFill(browser, batch_id, control_state, num_tabs)  # ADD num_tabs
+        result = await runFormFill(browser, batch_id, control_state, num_tabs, shard, tab_slot)
         
         # Add batchId to result
         result["batchId"] = batch_id
@@ -100,10 +86,10 @@ async def process_batch_task(cmd):
                 "timestamp": asyncio.get_event_loop().time(),
                 "failed_records": result.get("failed_records", 0)
             }
-            print(json.dumps(progress_data), flush=True)
+            progress_channel.emit(progress_data)
         
         result["commandId"] = cmd.get("commandId")
-        print(json.dumps(result), flush=True)
+        progress_channel.send(result)
         
     except TaskStoppedException as e:
         result = {
@@ -112,7 +98,7 @@ async def process_batch_task(cmd):
             "batchId": cmd.get("batchId"),
             "commandId": cmd.get("commandId")
         }
-        print(json.dumps(result), flush=True)
+        progress_channel.send(result)
     except Exception as e:
         tb = traceback.format_exc()
         result = {
@@ -122,9 +108,11 @@ async def process_batch_task(cmd):
             "batchId": cmd.get("batchId"),
             "commandId": cmd.get("commandId")
         }
-        print(json.dumps(result), flush=True)
+        progress_channel.send(result)
     finally:
-        cleanup_control_state(cmd.get("batchId"))
+        scheduler.release(cmd.get("batchId"))
+        control_registry.remove(cmd.get("batchId"))
+        _active_tasks.pop(cmd.get("batchId"), None)
 
 async def handle_process_batch_command(cmd):
     """Handle batch processing command - starts task in background"""
@@ -143,7 +131,7 @@ async def handle_process_batch_command(cmd):
         "numTabs": num_tabs,
         "commandId": cmd.get("commandId")
     }
-    print(json.dumps(ack_response), flush=True)
+    progress_channel.send(ack_response)
 
 async def handle_control_command(cmd):
     """Handle control commands (pause, resume, stop)"""
@@ -153,15 +141,7 @@ async def handle_control_command(cmd):
         
         print(f"[PY] Control command: {action} for batch {batch_id}", file=sys.stderr)
         
-        # Find control state by batch_id
-        target_state = None
-        target_task_id = None
-        
-        for task_id, state in _task_controls.items():
-            if state.get("batch_id") == batch_id:
-                target_state = state
-                target_task_id = task_id
-                break
+        target_state = control_registry.get(batch_id)
         
         if not target_state:
             result = {
@@ -169,11 +149,12 @@ async def handle_control_command(cmd):
                 "error": f"No active task found for batch {batch_id}",
                 "commandId": cmd.get("commandId")
             }
-            print(json.dumps(result), flush=True)
+            progress_channel.send(result)
             return
         
         if action == "pause":
-            target_state["paused"] = True
+            # Tabs block at their next record or step boundary until resumed
+            target_state.pause()
             result = {
                 "status": "PAUSED", 
                 "message": "Task paused",
@@ -182,7 +163,7 @@ async def handle_control_command(cmd):
             }
             
         elif action == "resume":
-            target_state["paused"] = False
+            target_state.resume()
             result = {
                 "status": "RESUMED", 
                 "message": "Task resumed",
@@ -191,22 +172,12 @@ async def handle_control_command(cmd):
             }
             
         elif action == "stop":
-            target_state["stopped"] = True
-            target_state["paused"] = False  # Unpause if paused
+            # Cancels the batch's tab tasks at whatever they are awaiting, paused or not
+            target_state.stop()
             
-            # Close all tabs except the main page
-            try:
-                browser = await get_browser()
-                pages = browser.tabs
-                if len(pages) > 1:
-                    for page in pages[1:]:
-                        try:
-                            await page.close()
-                        except Exception as e:
-                            print(f"Warning: Failed to close tab: {e}", file=sys.stderr)
-                    print(f"Closed {len(pages) - 1} additional tabs", file=sys.stderr)
-            except Exception as e:
-                print(f"Warning: Error closing tabs: {e}", file=sys.stderr)
+            # A batch still waiting for tabs just leaves the queue; a running batch's tabs
+            # go back to the pool as soon as their tasks unwind, while other batches keep theirs
+            scheduler.withdraw(batch_id, TaskStoppedException("Task was stopped by user"))
             
             result = {
                 "status": "STOPPED", 
@@ -215,7 +186,7 @@ async def handle_control_command(cmd):
                 "commandId": cmd.get("commandId")
             }
         
-        print(json.dumps(result), flush=True)
+        progress_channel.send(result)
         
     except Exception as e:
         tb = traceback.format_exc()
@@ -225,19 +196,22 @@ async def handle_control_command(cmd):
             "traceback": tb,
             "commandId": cmd.get("commandId")
         }
-        print(json.dumps(result), flush=True)
+        progress_channel.send(result)
 
 async def command_handler():
     """Main command handler for the worker"""
-    loop = asyncio.get_running_loop()
+    transport = await open_transport(progress_channel)
     
     while True:
-        line = await loop.run_in_executor(None, sys.stdin.readline)
-        if not line:
+        try:
+            cmd = await transport.read()
+        except FrameError as e:
+            progress_channel.send({"status": "FAILED", "error": str(e), "received": e.received})
+            continue
+        if cmd is None:
             break
         
         try:
-            cmd = json.loads(line.strip())
             action = cmd.get("action")
             
             print(f"[PY] Received action: {action}", file=sys.stderr)
@@ -250,15 +224,18 @@ async def command_handler():
                 await handle_control_command(cmd)
                 
             elif action == "login":
+                # The old browser and its standby tabs are replaced by this login
+                if _prewarm_task and not _prewarm_task.done():
+                    await _prewarm_task
+                standby_pool.reset()
                 browser = await get_browser(force_new=True)
-                page = await browser.get(
-                    "https://sso.taqeem.gov.sa/realms/REL_TAQEEM/protocol/openid-connect/auth"
-                    "?client_id=cli-qima-valuers&redirect_uri=https%3A%2F%2Fqima.taqeem.sa%2Fkeycloak%2Flogin%2Fcallback"
-                    "&scope=openid&response_type=code"
-                )
+                page = await browser.get(LOGIN_URL)
                 result = await startLogin(page, cmd.get("email", ""), cmd.get("password", ""), cmd.get("recordId"))
+                if result.get("status") == "LOGIN_SUCCESS":
+                    await capture_session(page)
+                    standby_pool.fill(browser)
                 result["commandId"] = cmd.get("commandId")
-                print(json.dumps(result), flush=True)
+                progress_channel.send(result)
                 
             elif action == "otp":
                 browser = await get_browser()
@@ -268,21 +245,57 @@ async def command_handler():
                         "error": "No active browser session. Please login first.",
                         "commandId": cmd.get("commandId")
                     }
-                    print(json.dumps(result), flush=True)
+                    progress_channel.send(result)
                     continue
                 page = browser.main_tab
                 result = await submitOtp(page, cmd.get("otp", ""), cmd.get("recordId"))
+                if result.get("status") == "SUCCESS":
+                    await capture_session(page)
+                    standby_pool.fill(browser)
                 result["commandId"] = cmd.get("commandId")
-                print(json.dumps(result), flush=True)
+                progress_channel.send(result)
+                
+            elif action in ["exportSession", "importSession"] and WORKER_SHARD is None:
+                progress_channel.send({
+                    "status": "FAILED",
+                    "error": f"{action} is only available to supervisor shards",
+                    "commandId": cmd.get("commandId")
+                })
+
+            elif action == "exportSession":
+                session = get_session()
+                result = {
+                    "status": "SUCCESS" if session else "FAILED",
+                    "session": session,
+                    "commandId": cmd.get("commandId")
+                }
+                if not session:
+                    result["error"] = "No session captured"
+                progress_channel.send(result)
+                
+            elif action == "importSession":
+                set_session(cmd.get("session"))
+                browser = await get_browser()
+                restored = bool(browser.main_tab) and await restore_session(browser.main_tab)
+                if restored:
+                    standby_pool.fill(browser)
+                result = {
+                    "status": "SUCCESS" if restored else "FAILED",
+                    "commandId": cmd.get("commandId")
+                }
+                if not restored:
+                    result["error"] = "Session could not be restored"
+                progress_channel.send(result)
                 
             elif action == "close":
+                standby_pool.reset()
                 await closeBrowser()
                 result = {
                     "status": "SUCCESS",
                     "message": "Browser closed successfully",
                     "commandId": cmd.get("commandId")
                 }
-                print(json.dumps(result), flush=True)
+                progress_channel.send(result)
                 break
                 
             elif action == "ping":
@@ -291,7 +304,7 @@ async def command_handler():
                     "message": "pong",
                     "commandId": cmd.get("commandId")
                 }
-                print(json.dumps(result), flush=True)
+                progress_channel.send(result)
                 
             else:
                 result = {
@@ -300,15 +313,8 @@ async def command_handler():
                     "supported_actions": ["processTaqeemBatch", "login", "otp", "close", "ping", "pause", "resume", "stop"],
                     "commandId": cmd.get("commandId")
                 }
-                print(json.dumps(result), flush=True)
+                progress_channel.send(result)
                 
-        except json.JSONDecodeError as e:
-            error_response = {
-                "status": "FAILED",
-                "error": f"Invalid JSON: {str(e)}",
-                "received": line.strip()
-            }
-            print(json.dumps(error_response), flush=True)
         except Exception as e:
             tb = traceback.format_exc()
             error_response = {
@@ -316,15 +322,36 @@ async def command_handler():
                 "error": f"Command handler error: {str(e)}",
                 "traceback": tb
             }
-            print(json.dumps(error_response), flush=True)
+            progress_channel.send(error_response)
+
+async def prewarm():
+    """Start Chrome before the first command and, when a saved session exists, fill the standby pool"""
+    try:
+        browser = await get_browser()
+        if get_session():
+            standby_pool.fill(browser)
+        print(f"[PY] Browser pre-warmed, {standby_pool.size if get_session() else 0} standby tabs requested", file=sys.stderr)
+    except Exception as e:
+        print(f"[PY] Browser pre-warm failed: {e}", file=sys.stderr)
 
 async def main():
     try:
+        global _prewarm_task
+        if PREWARM_BROWSER:
+            _prewarm_task = asyncio.create_task(prewarm())
         await command_handler()
     except Exception as e:
-        print(json.dumps({"status": "FATAL", "error": str(e)}), flush=True)
+        progress_channel.send({"status": "FATAL", "error": str(e)})
     finally:
+        await form_writer.close()
+        await http_submitter.close()
         await closeBrowser()
+        progress_channel.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    worker_processes = int(os.getenv("WORKER_PROCESSES", "1"))
+    if worker_processes > 1:
+        from supervisor import supervise
+        asyncio.run(supervise(worker_processes))
+    else:
+        asyncio.run(main())
\ No newline at end of file
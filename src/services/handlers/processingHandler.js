@@ -1,8 +1,12 @@
 const pythonWorkerService = require('../pythonWorkerService');
 
+// Replies that end a batch; its event stream subscription goes with them
+const FINAL_STATUSES = ['SUCCESS', 'FAILED', 'STOPPED'];
+
 module.exports = (socket, socketService) => {
   socket.on('start_taqeem_processing', async (data) => {
-    const { batchId, reportIds, numTabs = 1, actionType = 'process' } = data;
+    const { batchId, reportIds, numTabs = 1, priority = 0, actionType = 'process' } = data;
+    let unsubscribe = null;
     
     try {
       // Validate required fields
@@ -10,17 +14,19 @@ module.exports = (socket, socketService) => {
         throw new Error('batchId is required');
       }
 
-      // Validate numTabs
-      let validatedNumTabs = parseInt(numTabs);
-      if (isNaN(validatedNumTabs) || validatedNumTabs < 1) {
-        validatedNumTabs = 1;
-      } else if (validatedNumTabs > 10) {
-        validatedNumTabs = 10;
-      }
+      // Validate numTabs; "auto" lets the worker size the tab pool while the batch runs
+      let validatedNumTabs = numTabs === 'auto' ? 'auto' : parseInt(numTabs);
+      if (validatedNumTabs !== 'auto') {
+        if (isNaN(validatedNumTabs) || validatedNumTabs < 1) {
+          validatedNumTabs = 1;
+        } else if (validatedNumTabs > 10) {
+          validatedNumTabs = 10;
+        }
 
-      // Don't use more tabs than reports
-      if (validatedNumTabs > reportIds.length) {
-        validatedNumTabs = reportIds.length;
+        // Don't use more tabs than reports
+        if (validatedNumTabs > reportIds.length) {
+          validatedNumTabs = reportIds.length;
+        }
       }
 
       console.log(`[PROCESSING STARTED] Batch ${batchId} with ${reportIds.length} reports using ${validatedNumTabs} tabs`);
@@ -38,6 +44,23 @@ module.exports = (socket, socketService) => {
         userId: socket.userId
       });
 
+      // Follow the batch's own event stream so the session always holds its latest progress
+      unsubscribe = pythonWorkerService.subscribeBatch(batchId, (event) => {
+        const session = socketService.activeSessions.get(batchId);
+        if (session && event.type === 'PROGRESS') {
+          session.lastProgress = {
+            status: event.status,
+            current: event.current,
+            total: event.total,
+            percentage: event.percentage,
+            timestamp: event.timestamp
+          };
+        }
+        if (event.type !== 'PROGRESS' && FINAL_STATUSES.includes(event.status)) {
+          unsubscribe();
+        }
+      });
+
       // Emit start confirmation
       socket.emit('processing_started', {
         batchId,
@@ -63,7 +86,8 @@ module.exports = (socket, socketService) => {
         batchId, 
         reportIds, 
         validatedNumTabs, 
-        true
+        true,
+        priority
       );
       
       if (response.status === 'ACKNOWLEDGED') {
@@ -81,6 +105,9 @@ module.exports = (socket, socketService) => {
         timestamp: new Date().toISOString()
       });
       socketService.activeSessions.delete(batchId);
+      if (unsubscribe) {
+        unsubscribe();
+      }
     }
   });
 
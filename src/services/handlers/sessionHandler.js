@@ -4,7 +4,8 @@ module.exports = (socket, socketService) => {
       batchId,
       startedAt: session.startedAt,
       totalReports: session.reportIds.length,
-      userId: session.userId
+      userId: session.userId,
+      progress: session.lastProgress || null
     }));
     socket.emit('active_sessions', sessions);
   });
@@ -1,6 +1,26 @@
 const { spawn } = require('child_process');
+const { once } = require('events');
 const path = require('path');
 
+// 'framed' uses length-prefixed frames (see transport.py); 'jsonl' is the original line protocol
+const IPC_MODE = process.env.PY_IPC_MODE === 'framed' ? 'framed' : 'jsonl';
+const MAX_FRAME = 16 * 1024 * 1024;
+
+let msgpack = null;
+try {
+    msgpack = require('@msgpack/msgpack'); // optional; replies stay JSON without it
+} catch (error) {
+    msgpack = null;
+}
+
+function redactResponse(response) {
+    // Logged replies never carry the exported login session
+    if (response && typeof response === 'object' && 'session' in response) {
+        return { ...response, session: '[redacted]' };
+    }
+    return response;
+}
+
 class PythonWorkerService {
     constructor() {
         this.worker = null;
@@ -9,6 +29,9 @@ class PythonWorkerService {
         this.commandId = 0;
         this.isWorkerReady = false;
         this.completedBatches = new Set(); // Track completed batches to prevent duplicate emits
+        this.stdoutFrames = Buffer.alloc(0);
+        this.writeChain = Promise.resolve();
+        this.batchListeners = new Map(); // batchId -> Set of listeners, see subscribeBatch
     }
 
     startWorker() {
@@ -29,13 +52,25 @@ class PythonWorkerService {
 
         this.worker = spawn(pythonExecutable, [scriptPath], {
             cwd: scriptDir,
-            stdio: ['pipe', 'pipe', 'pipe']
+            stdio: ['pipe', 'pipe', 'pipe'],
+            env: {
+                ...process.env,
+                IPC_MODE,
+                IPC_ENCODING: IPC_MODE === 'framed' && msgpack ? 'msgpack' : 'json'
+            }
         });
 
         this.stdoutBuffer = '';
+        this.stdoutFrames = Buffer.alloc(0);
+        this.writeChain = Promise.resolve();
         this.isWorkerReady = false;
 
         this.worker.stdout.on('data', (data) => {
+            if (IPC_MODE === 'framed') {
+                this.handleFrames(data);
+                return;
+            }
+
             this.stdoutBuffer += data.toString();
             const lines = this.stdoutBuffer.split(/\r?\n/);
             this.stdoutBuffer = lines.pop() || '';
@@ -75,12 +110,79 @@ class PythonWorkerService {
         return this.worker;
     }
 
+    handleFrames(data) {
+        // [4-byte big-endian length][codec byte 'j' or 'm'][payload]
+        this.stdoutFrames = Buffer.concat([this.stdoutFrames, data]);
+        while (this.stdoutFrames.length >= 4) {
+            const length = this.stdoutFrames.readUInt32BE(0);
+            if (length === 0 || length > MAX_FRAME) {
+                console.error(`[PY] Invalid frame length ${length}, dropping buffered output`);
+                this.stdoutFrames = Buffer.alloc(0);
+                return;
+            }
+            if (this.stdoutFrames.length < 4 + length) return;
+
+            const codec = String.fromCharCode(this.stdoutFrames[4]);
+            const payload = this.stdoutFrames.subarray(5, 4 + length);
+            this.stdoutFrames = this.stdoutFrames.subarray(4 + length);
+            try {
+                const message = codec === 'm' ? msgpack.decode(payload) : JSON.parse(payload.toString('utf8'));
+                this.handleWorkerMessage(message);
+            } catch (error) {
+                console.error('[PY] Failed to decode worker frame:', error);
+            }
+        }
+    }
+
     handleWorkerOutput(line) {
+        let response;
+        try {
+            response = JSON.parse(line);
+        } catch (error) {
+            console.error('[PY] Failed to parse worker output:', line, error);
+            return;
+        }
+        this.handleWorkerMessage(response);
+    }
+
+    subscribeBatch(batchId, listener) {
+        // Every progress event and reply of one batch, in arrival order; returns the unsubscribe function
+        const key = String(batchId);
+        let listeners = this.batchListeners.get(key);
+        if (!listeners) {
+            listeners = new Set();
+            this.batchListeners.set(key, listeners);
+        }
+        listeners.add(listener);
+        return () => {
+            listeners.delete(listener);
+            if (!listeners.size && this.batchListeners.get(key) === listeners) {
+                this.batchListeners.delete(key);
+            }
+        };
+    }
+
+    publishBatchEvent(response) {
+        const listeners = this.batchListeners.get(String(response.batchId));
+        if (!listeners) {
+            return;
+        }
+        for (const listener of [...listeners]) {
+            try {
+                listener(response);
+            } catch (error) {
+                console.error('[PY] Batch listener failed:', error);
+            }
+        }
+    }
+
+    handleWorkerMessage(response) {
         try {
-            const response = JSON.parse(line);
-            console.log('[PY] Response:', response);
+            if (response.batchId !== undefined && response.batchId !== null) {
+                this.publishBatchEvent(response);
+            }
 
-            // Handle progress updates
+            // Handle progress updates; these arrive as coalesced snapshots and are not logged one by one
             if (response.type === 'PROGRESS') {
                 const io = require('./socketService').getIO();
                 if (io && response.batchId) {
@@ -109,6 +211,8 @@ class PythonWorkerService {
                 return;
             }
 
+            console.log('[PY] Response:', redactResponse(response));
+
             // Handle command responses
             if (response.commandId !== undefined) {
                 const handler = this.pendingCommands.get(response.commandId);
@@ -149,8 +253,34 @@ class PythonWorkerService {
             }
 
         } catch (error) {
-            console.error('[PY] Failed to parse worker output:', line, error);
+            console.error('[PY] Failed to handle worker message:', redactResponse(response), error);
+        }
+    }
+
+    encodeCommand(command) {
+        if (IPC_MODE !== 'framed') {
+            return JSON.stringify(command) + '\n';
         }
+        // Commands are small; JSON frames keep them readable in logs on both sides
+        const payload = Buffer.from(JSON.stringify(command), 'utf8');
+        const header = Buffer.alloc(5);
+        header.writeUInt32BE(payload.length + 1, 0);
+        header.write('j', 4, 'ascii');
+        return Buffer.concat([header, payload]);
+    }
+
+    writeToWorker(data) {
+        // Writes are chained so a full stdin pipe holds back later commands instead of buffering them unbounded
+        const worker = this.worker;
+        this.writeChain = this.writeChain.catch(() => {}).then(async () => {
+            if (!worker || !worker.stdin.writable) {
+                throw new Error('Worker stdin is not writable');
+            }
+            if (!worker.stdin.write(data)) {
+                await once(worker.stdin, 'drain');
+            }
+        });
+        return this.writeChain;
     }
 
     async sendCommand(command) {
@@ -172,14 +302,15 @@ class PythonWorkerService {
                 }
             });
 
-            try {
-                this.worker.stdin.write(JSON.stringify(commandWithId) + '\n');
-                console.log(`[PY] Sent command: ${command.action} (id: ${commandId})`, 
-                    command.numTabs ? `with ${command.numTabs} tabs` : '');
-            } catch (error) {
-                this.pendingCommands.delete(commandId);
-                reject(new Error(`Failed to send command to worker: ${error.message}`));
-            }
+            this.writeToWorker(this.encodeCommand(commandWithId))
+                .then(() => {
+                    console.log(`[PY] Sent command: ${command.action} (id: ${commandId})`, 
+                        command.numTabs ? `with ${command.numTabs} tabs` : '');
+                })
+                .catch((error) => {
+                    this.pendingCommands.delete(commandId);
+                    reject(new Error(`Failed to send command to worker: ${error.message}`));
+                });
         });
     }
 
@@ -204,13 +335,15 @@ class PythonWorkerService {
         });
     }
 
-    async processTaqeemBatch(batchId, reportIds, numTabs = 1, socketMode = true) {
-        // Validate and sanitize numTabs
-        let validatedNumTabs = parseInt(numTabs);
-        if (isNaN(validatedNumTabs) || validatedNumTabs < 1) {
-            validatedNumTabs = 1;
-        } else if (validatedNumTabs > 10) {
-            validatedNumTabs = 10; // Max safety limit
+    async processTaqeemBatch(batchId, reportIds, numTabs = 1, socketMode = true, priority = 0) {
+        // Validate and sanitize numTabs; "auto" is passed through for the worker's tab controller
+        let validatedNumTabs = numTabs === 'auto' ? 'auto' : parseInt(numTabs);
+        if (validatedNumTabs !== 'auto') {
+            if (isNaN(validatedNumTabs) || validatedNumTabs < 1) {
+                validatedNumTabs = 1;
+            } else if (validatedNumTabs > 10) {
+                validatedNumTabs = 10; // Max safety limit
+            }
         }
 
         console.log(`[PY] Processing batch ${batchId} with ${reportIds.length} reports using ${validatedNumTabs} tabs`);
@@ -220,7 +353,8 @@ class PythonWorkerService {
             batchId,
             reportIds,
             numTabs: validatedNumTabs,
-            socketMode
+            socketMode,
+            priority: parseInt(priority) || 0
         });
     }
 